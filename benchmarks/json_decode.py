@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Micro benchmark of the JSON decoders on a Tastypie style listing.
+
+    PYTHONPATH=. python benchmarks/json_decode.py [--records N] [--repeat N]
+"""
+
+import argparse
+import datetime
+import json
+import timeit
+from syndicate import data
+
+
+def make_listing(records):
+    now = datetime.datetime(2018, 1, 28, 12, 30, 15, 123456)
+    return json.dumps({
+        "meta": {
+            "limit": records,
+            "offset": 0,
+            "total_count": records,
+            "next": None
+        },
+        "data": [{
+            "id": i,
+            "name": "record %d" % i,
+            "email": "user%d@example.com" % i,
+            "kind": "cake",
+            "created": (now + datetime.timedelta(seconds=i)).isoformat(),
+            "modified": (now + datetime.timedelta(minutes=i)).isoformat(),
+            "birthday": "1980-01-%02d" % (i % 28 + 1),
+        } for i in range(records)]
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    body = make_listing(args.records)
+    decoders = [
+        ('normal', data.NormalJSONDecoder().decode),
+        ('fast', data.FastJSONDecoder().decode),
+        ('fast+fields', data.FastJSONDecoder(
+            ('created', 'modified', 'birthday')).decode),
+        ('lazy', data.LazyJSONDecoder().decode),
+        ('stdlib (no dates)', json.loads),
+    ]
+    raw_body = body.encode()
+    for name in ('orjson', 'ujson'):
+        if name in data.serializers:
+            decode = data.serializers[name].decode
+            decoders.append((name, lambda s, decode=decode: decode(raw_body)))
+    baseline = None
+    for name, decode in decoders:
+        best = min(timeit.repeat(lambda: decode(body), number=1,
+                                 repeat=args.repeat))
+        if baseline is None:
+            baseline = best
+        print('%-20s %8.2f ms  %6.0f records/s  %5.1fx' % (name, best * 1000,
+              args.records / best, baseline / best))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""
+Local stand-in for a Tastypie style API to benchmark against.
+
+    GET /api/v1/items/?limit=N&offset=N   pages with meta.next/total_count
+    GET /api/v1/items/<id>/               a single item
+
+Responses are encoded with the serializer matching the Accept header and
+cached, so the server spends as little time as possible per request.
+
+    PYTHONPATH=. python benchmarks/server.py [--port N] [--latency S]
+"""
+
+import argparse
+import asyncio
+import datetime
+import threading
+from aiohttp import web
+from syndicate import data
+
+urn = '/api/v1/'
+
+
+def make_item(i, payload):
+    created = datetime.datetime(2018, 1, 28) + datetime.timedelta(seconds=i)
+    return {
+        "id": i,
+        "name": "item %d" % i,
+        "created": created.isoformat(),
+        "payload": "x" * payload
+    }
+
+
+class Server(object):
+    """ Serve `total` items of about `payload` bytes each after waiting
+    `latency` seconds per request. """
+
+    def __init__(self, total=10000, payload=100, latency=0):
+        self.total = total
+        self.payload = payload
+        self.latency = latency
+        self.encoded = {}
+        self.encoders = {}
+        for name in ('json', 'msgpack'):
+            if name in data.serializers:
+                x = data.serializers[name]
+                self.encoders[x.mime] = x
+        self.app = web.Application()
+        self.app.router.add_get(urn + 'items/', self.list)
+        self.app.router.add_get(urn + 'items/{id:\\d+}/', self.detail)
+        self.runner = None
+
+    def respond(self, request, key, make):
+        mime = request.headers.get('accept', '').split(',', 1)[0]
+        serializer = self.encoders.get(mime, self.encoders['application/json'])
+        body = self.encoded.get((serializer.mime, key))
+        if body is None:
+            body = serializer.encode(make())
+            if isinstance(body, str):
+                body = body.encode()
+            self.encoded[serializer.mime, key] = body
+        return web.Response(body=body, content_type=serializer.mime)
+
+    async def list(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        limit = int(request.query.get('limit', 20))
+        offset = int(request.query.get('offset', 0))
+        end = min(offset + limit, self.total)
+
+        def make():
+            if end < self.total:
+                next = '%sitems/?limit=%d&offset=%d' % (urn, limit, end)
+            else:
+                next = None
+            return {
+                "success": True,
+                "meta": {
+                    "limit": limit,
+                    "offset": offset,
+                    "total_count": self.total,
+                    "next": next
+                },
+                "data": [make_item(i, self.payload)
+                         for i in range(offset, end)]
+            }
+        return self.respond(request, (limit, offset), make)
+
+    async def detail(self, request):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        i = int(request.match_info['id'])
+
+        def make():
+            return {"success": True, "data": make_item(i, self.payload)}
+        return self.respond(request, i, make)
+
+    async def start(self, host='127.0.0.1', port=0):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        return 'http://%s:%d' % self.runner.addresses[0][:2]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+def start_in_thread(**options):
+    """ Run a `Server` on its own event loop in a daemon thread and return
+    its base URL. """
+    loop = asyncio.new_event_loop()
+    server = Server(**options)
+    uri = loop.run_until_complete(server.start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return uri
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--total', type=int, default=10000)
+    parser.add_argument('--payload', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0)
+    args = parser.parse_args()
+    server = Server(args.total, args.payload, args.latency)
+    web.run_app(server.app, port=args.port, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
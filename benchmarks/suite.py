@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Throughput and latency benchmarks of the adapters, pagers and serializers
+against the local stand-in server in `benchmarks/server.py`.
+
+Each scenario runs in a fresh process so its peak RSS is its own.  Results
+are written as JSON with `--output` and can be compared with an earlier run
+using `--compare`.
+
+    PYTHONPATH=. python benchmarks/suite.py [--output new.json]
+        [--compare old.json] [--latency S] [--payload N] [--only NAME]
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+import syndicate
+from syndicate import data
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import server  # noqa
+
+
+def scenarios():
+    serializers = [x for x in data.serializers if x != 'xml']
+    for aio in (False, True):
+        yield aio, 'get', 'json'
+        for name in serializers:
+            yield aio, 'pager', name
+
+
+def scenario_name(aio, kind, serializer):
+    return '%s-%s-%s' % ('aio' if aio else 'requests', kind, serializer)
+
+
+def make_service(uri, aio, serializer):
+    return syndicate.Service(uri=uri, urn=server.urn, aio=aio,
+                             serializer=serializer, metrics=True)
+
+
+def run_get(svc, options):
+    ids = [str(i % options['total']) for i in range(options['requests'])]
+    outcomes = svc.get_many(ids, 'items', concurrency=options['concurrency'])
+    return len(ids), sum(1 for x in outcomes if x.error)
+
+
+async def run_get_aio(svc, options):
+    ids = [str(i % options['total']) for i in range(options['requests'])]
+    outcomes = await svc.get_many(ids, 'items',
+                                  concurrency=options['concurrency'])
+    return len(ids), sum(1 for x in outcomes if x.error)
+
+
+def run_pager(svc, options):
+    pager = svc.get_pager('items', page_size=options['page_size'])
+    return sum(1 for x in pager), 0
+
+
+async def run_pager_aio(svc, options):
+    count = 0
+    async for x in svc.get_pager('items', page_size=options['page_size']):
+        count += 1
+    return count, 0
+
+
+runners = {
+    (False, 'get'): run_get,
+    (True, 'get'): run_get_aio,
+    (False, 'pager'): run_pager,
+    (True, 'pager'): run_pager_aio,
+}
+
+
+def run_scenario(uri, aio, kind, serializer, options):
+    """ Run one scenario; called in a child process. """
+    runner = runners[aio, kind]
+    if aio:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        svc = make_service(uri, aio, serializer)
+        start = time.perf_counter()
+        count, errors = loop.run_until_complete(runner(svc, options))
+        elapsed = time.perf_counter() - start
+        loop.run_until_complete(svc.adapter.close())
+        loop.close()
+    else:
+        svc = make_service(uri, aio, serializer)
+        start = time.perf_counter()
+        count, errors = runner(svc, options)
+        elapsed = time.perf_counter() - start
+    series = max(svc.stats()['requests'],
+                 key=lambda x: x['latency']['count'])
+    latency = series['latency']
+    return {
+        "name": scenario_name(aio, kind, serializer),
+        "adapter": 'aio' if aio else 'requests',
+        "scenario": kind,
+        "serializer": serializer,
+        "count": count,
+        "errors": errors,
+        "seconds": elapsed,
+        "requests": latency['count'],
+        "requests_per_sec": latency['count'] / elapsed,
+        "items_per_sec": count / elapsed,
+        "p50": latency['p50'],
+        "p99": latency['p99'],
+        # Kilobytes on Linux, bytes on macOS.
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def compare(old, new):
+    before = dict((x['name'], x) for x in old['results'])
+    for x in new['results']:
+        prev = before.get(x['name'])
+        if prev is None:
+            continue
+        print('%-28s %+6.1f%% items/s  %+6.1f%% p99  %+6.1f%% rss' % (
+              x['name'],
+              (x['items_per_sec'] / prev['items_per_sec'] - 1) * 100,
+              (x['p99'] / prev['p99'] - 1) * 100,
+              (x['peak_rss'] / prev['peak_rss'] - 1) * 100))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', help='Write results as JSON to a file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--only', help='Run scenarios containing NAME')
+    parser.add_argument('--total', type=int, default=10000)
+    parser.add_argument('--payload', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--page-size', type=int, default=100)
+    args = parser.parse_args()
+    options = {
+        "total": args.total,
+        "payload": args.payload,
+        "latency": args.latency,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "page_size": args.page_size,
+    }
+    uri = server.start_in_thread(total=args.total, payload=args.payload,
+                                 latency=args.latency)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for aio, kind, serializer in scenarios():
+        if args.only and args.only not in scenario_name(aio, kind, serializer):
+            continue
+        with concurrent.futures.ProcessPoolExecutor(
+                1, mp_context=context) as pool:
+            result = pool.submit(run_scenario, uri, aio, kind, serializer,
+                                 options).result()
+        results.append(result)
+        print('%-28s %9.0f req/s %9.0f items/s  p99 %7.2f ms  rss %7d' % (
+              result['name'], result['requests_per_sec'],
+              result['items_per_sec'], result['p99'] * 1000,
+              result['peak_rss']))
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": options,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
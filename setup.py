@@ -23,11 +23,20 @@ setup(
     license='MIT',
     long_description=long_desc(),
     packages=find_packages(),
+    python_requires='>=3.7',
     install_requires=[
         'requests',
         'python-dateutil',
         'aiohttp>=3.5.1',
     ],
+    extras_require={
+        'orjson': ['orjson'],
+        'ujson': ['ujson'],
+        'msgpack': ['msgpack'],
+        'http2': ['httpx[http2]'],
+        'brotli': ['brotli'],
+        'zstd': ['zstandard'],
+    },
     test_suite='test',
     classifiers=[
         'Development Status :: 5 - Production/Stable',
@@ -35,8 +44,6 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Topic :: Software Development :: Libraries',
     ]
@@ -4,7 +4,10 @@ import syndicate.client
 __all__ = (
     'adapters',
     'data',
-    'client'
+    'client',
+    'cache',
+    'stats',
+    'compression'
 )
 
 Service = syndicate.client.Service
@@ -2,5 +2,7 @@
 __all__ = (
     'requests',
     'aio',
+    'loop_thread',
+    'http2',
     'base'
 )
@@ -6,9 +6,15 @@ This code requires Python 3.4 or newer.
 import aiohttp
 import asyncio
 import collections
+import concurrent.futures
 import functools
+import inspect
 import json
 import platform
+import time
+from syndicate import cache as m_cache
+from syndicate import compression as m_compression
+from syndicate import data as m_data
 from syndicate.adapters import base
 
 
@@ -26,20 +32,145 @@ if platform.python_version() <= '3.5.0':
     monkey_patch_issue_25593()
 
 
+class AioLimiter(base.Limiter):
+    """ Request pacing for the aio adapter. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.semaphores = {}
+
+    async def acquire(self, url):
+        host = self.host(url)
+        start = time.monotonic()
+        sem = None
+        if self.max_per_host:
+            sem = self.semaphores.get(host)
+            if sem is None:
+                sem = asyncio.Semaphore(self.max_per_host)
+                self.semaphores[host] = sem
+        self.queued += 1
+        try:
+            if sem is not None:
+                await sem.acquire()
+            if self.bucket is not None:
+                try:
+                    delay = self.bucket.reserve()
+                    if delay:
+                        await asyncio.sleep(delay)
+                except BaseException:
+                    if sem is not None:
+                        sem.release()
+                    raise
+        finally:
+            self.queued -= 1
+        self.in_flight += 1
+        self.requests += 1
+        self.total_wait += time.monotonic() - start
+        return host
+
+    def release(self, host):
+        self.in_flight -= 1
+        if self.max_per_host:
+            self.semaphores[host].release()
+
+
+class Coalesced(object):
+    """ A GET in flight and the number of callers sharing it. """
+
+    def __init__(self):
+        self.task = None
+        self.joiners = 0
+
+
 class AioAdapter(base.AdapterBase):
+    """ With `coalesce` set, identical GET requests made while one is
+    already in flight share that request and its outcome.  Callers that
+    join a request get a copy of its result.
+
+    Bodies of at least `decode_threshold` bytes are decoded, or compressed,
+    in the `decode_executor` (the loop's default executor if None) so they
+    don't stall the loop.  Decoding in a `ProcessPoolExecutor` can use other
+    cores but requires a registered serializer and the result is pickled
+    back. """
+
+    limiter_class = AioLimiter
+    retry_exceptions = aiohttp.ClientConnectionError, asyncio.TimeoutError
 
     def __init__(self, loop=None, session_config=None, connector_config=None,
-                 **config):
+                 coalesce=False, decode_threshold=None, decode_executor=None,
+                 pools=None, pool_url=None, **config):
         super().__init__(**config)
+        self.coalesce = coalesce
+        self.decode_threshold = decode_threshold
+        self.decode_executor = decode_executor
+        self.inflight = {}
         if loop is None:
             loop = asyncio.get_event_loop()
         self.loop = loop
-        c = aiohttp.TCPConnector(loop=loop, **(connector_config or {}))
-        timeout = aiohttp.ClientTimeout(connect=self.connect_timeout)
-        self.session = aiohttp.ClientSession(connector=c, timeout=timeout,
-                                             **(session_config or {}))
+        self.session = self.make_session(session_config, connector_config,
+                                         pools, pool_url)
         self.headers = {}
 
+    def make_session(self, session_config, connector_config, pools,
+                     pool_url):
+        loop = self.loop
+        session_config = dict(session_config or {})
+        if pools is not None:
+            c = pools.get(('aio', loop), pool_url, functools.partial(
+                self.make_shared_connector, pools, loop, connector_config),
+                usable=lambda x: not x.closed)
+            session_config['connector_owner'] = False
+        else:
+            c = aiohttp.TCPConnector(loop=loop, **(connector_config or {}))
+        timeout = aiohttp.ClientTimeout(connect=self.connect_timeout)
+        session_config['trace_configs'] = [self.make_trace_config()] + \
+            list(session_config.get('trace_configs', ()))
+        return aiohttp.ClientSession(connector=c, timeout=timeout,
+                                     **session_config)
+
+    @staticmethod
+    def make_shared_connector(pools, loop, connector_config, key):
+        config = dict({
+            "limit": 0,
+            "limit_per_host": pools.size(key),
+            "use_dns_cache": True,
+            "ttl_dns_cache": pools.dns_ttl
+        }, **(connector_config or {}))
+        return aiohttp.TCPConnector(loop=loop, **config)
+
+    def make_trace_config(self):
+        """ Time connection pool waits, DNS lookups, connecting and the time
+        to the first byte for the listeners.  Each `*_start` signal takes a
+        mark and each `*_end` signal emits the time since the last mark. """
+        trace = aiohttp.TraceConfig()
+
+        async def request_start(session, ctx, params):
+            if self.listeners:
+                ctx.method = params.method
+                ctx.url = str(params.url.with_query(None))
+                ctx.mark = time.perf_counter()
+
+        async def start(session, ctx, params):
+            if hasattr(ctx, 'mark'):
+                ctx.mark = time.perf_counter()
+
+        def end(phase):
+            async def handler(session, ctx, params):
+                if hasattr(ctx, 'mark'):
+                    ctx.mark = self.emit(phase, ctx.method, ctx.url, ctx.mark)
+            return handler
+
+        trace.on_request_start.append(request_start)
+        trace.on_connection_queued_start.append(start)
+        trace.on_connection_queued_end.append(end('queue'))
+        trace.on_connection_create_start.append(start)
+        trace.on_dns_resolvehost_start.append(start)
+        trace.on_dns_resolvehost_end.append(end('dns'))
+        trace.on_connection_create_end.append(end('connect'))
+        trace.on_connection_reuseconn.append(start)
+        trace.on_request_end.append(end('ttfb'))
+        return trace
+
     def set_header(self, header, value):
         self.headers[header] = value
 
@@ -55,18 +186,229 @@ class AioAdapter(base.AdapterBase):
                 return x.value
         raise KeyError(cookie)
 
-    def get_pager(self, *args, **kwargs):
+    def get_pager(self, *args, concurrency=None, **kwargs):
+        if concurrency:
+            return AioFanoutPager(*args, concurrency=concurrency, **kwargs)
         return AioPager(*args, **kwargs)
 
     async def request(self, method, url, data=None, query=None, callback=None,
                 timeout=None):
-        if data is not None:
-            data = self.serializer.encode(data)
+        if self.coalesce and data is None and method.lower() == 'get':
+            final_resp = await self.coalesced(method, url, query, timeout)
+        else:
+            final_resp = await self.send(method, url, data, query, timeout)
+        if callback is not None:
+            mark = self.listeners and time.perf_counter()
+            callback(final_resp)
+            if mark:
+                self.emit('callback', method, url, mark)
+        return final_resp
+
+    async def coalesced(self, method, url, query, timeout):
+        key = m_cache.request_key(url, query)
+        shared = self.inflight.get(key)
+        if shared is None:
+            shared = self.inflight[key] = Coalesced()
+            shared.task = asyncio.ensure_future(self.send_shared(
+                key, shared, method, url, query, timeout))
+            first = True
+        else:
+            shared.joiners += 1
+            first = False
+        # Shielded so a cancelled caller doesn't cancel it for the others.
+        resp, copies = await asyncio.shield(shared.task)
+        return resp if first else copies.pop()
+
+    async def send_shared(self, key, shared, method, url, query, timeout):
+        """ Send a coalesced request and copy its result for each caller
+        that joined it; the caller that started it gets the original. """
+        try:
+            resp = await self.send(method, url, None, query, timeout)
+        finally:
+            del self.inflight[key]
+        return resp, [m_cache.clone(resp) for i in range(shared.joiners)]
+
+    async def send(self, method, url, data, query, timeout):
+        key, entry = self.cache_lookup(method, url, query)
+        if entry is not None and self.cache.is_fresh(entry):
+            return self.cache.hit(entry)
         if timeout is None:
             timeout = self.request_timeout
-        await self.authenticate()
+        headers = self.headers
+        if entry is not None:
+            headers = dict(headers, **entry.validators())
+        if data is not None:
+            data, headers = await self.compress_body(
+                method, self.serializer.encode(data), headers)
+        result, body = await self.authorized_fetch(
+            method, url, timeout, headers, data=data,
+            params=self.make_params(query))
+        if self.compress:
+            self.record_compression(result.headers, self.wire_size(result),
+                                    body)
+        mark = self.listeners and time.perf_counter()
+        resp = await self.decode_response(result, body)
+        if mark:
+            mark = self.emit('decode', method, url, mark)
+        if key is not None:
+            data = self.cache_filter(key, entry, resp)
+        else:
+            data = self.ingress_filter(resp)
+        if mark:
+            self.emit('filter', method, url, mark)
+        return data
+
+    async def compress_body(self, method, data, headers=None):
+        """ `compressed` but bodies of at least `decode_threshold` bytes are
+        compressed in the `decode_executor`. """
+        c = self.compress
+        if isinstance(data, str):
+            data = data.encode()
+        if not c or not c.applies(method, data) or \
+           self.decode_threshold is None or len(data) < self.decode_threshold:
+            return self.compressed(method, data, headers)
+        loop = asyncio.get_event_loop()
+        compressed = await loop.run_in_executor(
+            self.decode_executor, m_compression.compress, c.encoding, data,
+            c.level)
+        data, extra = c.finish(data, compressed)
+        if extra:
+            headers = dict(headers or {}, **extra)
+        return data, headers
+
+    def wire_size(self, result):
+        """ Bytes of the response body as received, before decompression.
+        """
+        size = getattr(result.content, 'total_raw_bytes', None)
+        if size is None:
+            size = result.headers.get('content-length')
+        return size and int(size)
+
+    async def authorized_fetch(self, method, url, timeout, headers,
+                               **kwargs):
+        """ `fetch` with `headers` as updated by the auth.  A 401 response
+        is retried once if the auth renewed its credentials. """
+        auth_headers = await self.authenticate(headers)
+        result, body = await self.fetch(method, url, timeout,
+                                        headers=auth_headers, **kwargs)
+        if result.status == 401 and await self.reauthenticate(auth_headers):
+            result.release()
+            auth_headers = await self.authenticate(headers)
+            result, body = await self.fetch(method, url, timeout,
+                                            headers=auth_headers, **kwargs)
+        return result, body
+
+    async def fetch(self, method, url, timeout, read=True, **kwargs):
+        """ Send a request through the limiter and retry policy, if any.
+        Returns the response and, if `read` is set, its body. """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            ticket = self.breaker and self.breaker.allow()
+            host = None
+            failed = None
+            status = 'error'
+            body = None
+            sent = time.monotonic()
+            try:
+                if self.limiter:
+                    mark = self.listeners and time.perf_counter()
+                    host = await self.limiter.acquire(url)
+                    if mark:
+                        self.emit('queue', method, url, mark)
+                sent = time.monotonic()
+                result = await asyncio.wait_for(self.open(method, url,
+                                                          **kwargs), timeout)
+                if read:
+                    mark = self.listeners and time.perf_counter()
+                    body = await result.read()
+                    if mark:
+                        self.emit('read', method, url, mark)
+                else:
+                    body = None
+            except self.retry_exceptions as e:
+                failed = True
+                delay = self.retry_delay(method, attempt, started, error=e)
+                if delay is None:
+                    raise
+            else:
+                status = result.status
+                failed = status >= 500
+                delay = self.retry_delay(method, attempt, started,
+                                         status=status,
+                                         headers=result.headers)
+                if delay is None:
+                    if not read and host is not None:
+                        # The body is yet to be streamed; the response
+                        # keeps the limiter slot until it is released.
+                        result = HeldResponse(result, self.limiter, host)
+                        host = None
+                    return result, body
+                result.release()
+            finally:
+                elapsed = time.monotonic() - sent
+                if self.breaker:
+                    self.breaker.record(elapsed, failed, ticket)
+                if self.metrics:
+                    self.metrics.record(method, url, status, elapsed,
+                                        len(body or b''),
+                                        len(kwargs.get('data') or b''))
+                if host is not None:
+                    self.limiter.release(host)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def open(self, method, url, **kwargs):
+        """ Awaitable of the response to a request, before its body is read.
+        The response must be released. """
+        return self.session.request(method, url, **kwargs)
+
+    async def call_outcome(self, sem, key, fn):
+        async with sem:
+            try:
+                return base.Outcome(key, await fn(), None)
+            except Exception as e:
+                return base.Outcome(key, None, e)
+
+    async def gather_outcomes(self, calls, concurrency, expand=None):
+        sem = asyncio.Semaphore(concurrency)
+        outcomes = await asyncio.gather(*[self.call_outcome(sem, key, fn)
+                                          for key, fn in calls])
+        if expand is None:
+            return outcomes
+        return [x for outcome in outcomes for x in expand(outcome)]
+
+    async def iter_outcomes(self, calls, concurrency, expand=None):
+        sem = asyncio.Semaphore(concurrency)
+        tasks = [asyncio.ensure_future(self.call_outcome(sem, key, fn))
+                 for key, fn in calls]
+        try:
+            for x in asyncio.as_completed(tasks):
+                outcome = await x
+                for item in expand(outcome) if expand else (outcome,):
+                    yield item
+        finally:
+            for x in tasks:
+                x.cancel()
+
+    def bulk_writer(self, send, **options):
+        return AioBulkWriter(send, **options)
+
+    async def warmup(self, url, connections):
+        async def head():
+            try:
+                (await self.open('HEAD', url)).release()
+            except self.retry_exceptions:
+                return False
+            return True
+        return sum(await asyncio.gather(*[head()
+                                          for i in range(connections)]))
+
+    def make_params(self, query):
+        if not query:
+            return None
         params = []
-        for key, values in query.items():
+        for key, values in (query or {}).items():
             if not isinstance(values, str):
                 try:
                     params.extend((key, str(val)) for val in values)
@@ -75,36 +417,201 @@ class AioAdapter(base.AdapterBase):
                 else:
                     continue
             params.append((key, str(values)))
-        r = self.session.request(method, url, data=data, headers=self.headers,
-                                 params=params)
-        result = await asyncio.wait_for(r, timeout)
-        body = await result.read()
-        content = body and self.serializer.decode(body.decode())
-        resp = base.Response(http_code=result.status, headers=result.headers,
+        return params
+
+    def make_response(self, result, body):
+        content = body and self.decode(body,
+                                       result.headers.get('content-type'))
+        return base.Response(http_code=result.status, headers=result.headers,
                              content=content, error=None, extra=result)
-        final_resp = self.ingress_filter(resp)
-        if callback is not None:
-            callback(final_resp)
-        return final_resp
 
-    async def authenticate(self):
-        if callable(self.auth):
-            await self.auth()
+    async def decode_response(self, result, body):
+        """ Like `make_response` but large bodies are decoded in the
+        `decode_executor`. """
+        if self.decode_threshold is None or not body or \
+           len(body) < self.decode_threshold:
+            return self.make_response(result, body)
+        serializer = self.decoder(result.headers.get('content-type'))
+        if isinstance(self.decode_executor,
+                      concurrent.futures.ProcessPoolExecutor):
+            serializer = self.serializer_name(serializer)
+        loop = asyncio.get_event_loop()
+        content = await loop.run_in_executor(self.decode_executor,
+                                             base.decode_with, serializer,
+                                             body)
+        return base.Response(http_code=result.status, headers=result.headers,
+                             content=content, error=None, extra=result)
+
+    def serializer_name(self, serializer):
+        for name, x in m_data.serializers.items():
+            if x is serializer:
+                return name
+        raise ValueError('Decoding in a process requires a registered '
+                         'serializer: %r' % (serializer,))
+
+    async def stream(self, method, url, parser, query=None, timeout=None,
+                     meta_key='meta', chunk_size=65536):
+        if timeout is None:
+            timeout = self.request_timeout
+        result, body = await self.authorized_fetch(
+            method, url, timeout, self.headers, read=False,
+            params=self.make_params(query))
+        if result.status >= 400:
+            try:
+                body = await result.read()
+            finally:
+                result.release()
+            return self.ingress_filter(await self.decode_response(result,
+                                                                  body))
+        return AioListStream(result.content.iter_chunked(chunk_size), parser,
+                             meta_key=meta_key, close=result.release)
+
+    async def authenticate(self, headers):
+        """ Headers for a request as updated by the auth, which is called
+        with an `AuthRequest` and may be a coroutine function. """
+        if not callable(self.auth):
+            return headers
+        request = AuthRequest(self, dict(headers))
+        r = self.auth(request)
+        if inspect.isawaitable(r):
+            await r
+        return request.headers
+
+    async def reauthenticate(self, headers):
+        """ A request made with `headers` was refused with a 401.  Returns
+        True if the auth renewed its credentials and it may be retried. """
+        unauthorized = getattr(self.auth, 'unauthorized', None)
+        return unauthorized is not None and \
+            await unauthorized(self, headers)
 
     async def close(self):
         await self.session.close()
 
 
+class HeldResponse(object):
+    """ A response whose body hasn't been read, holding its request's
+    limiter slot until it is released. """
+
+    def __init__(self, response, limiter, host):
+        self.response = response
+        self.limiter = limiter
+        self.host = host
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def release(self):
+        self.response.release()
+        if self.host is not None:
+            self.limiter.release(self.host)
+            self.host = None
+
+
+class AioListStream(m_data.ListStream):
+    """ ListStream for `async for`. """
+
+    def __aiter__(self):
+        return self.iter_items()
+
+    async def iter_items(self):
+        try:
+            async for chunk in self.chunks:
+                for x in self.parser.feed(chunk):
+                    yield x
+            for x in self.parser.feed(b'', eof=True):
+                yield x
+        finally:
+            self.close()
+
+
+class AioBulkWriter(base.BulkWriterBase):
+    """ Bulk writer that sends batches as tasks.  Use it with `async with`
+    or await `close()` to send the final batch and wait. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.tasks = set()
+        self.timer = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def add(self, obj):
+        batch = self.queue(obj)
+        if batch:
+            await self.submit(batch)
+        elif self.max_delay and self.timer is None:
+            loop = asyncio.get_event_loop()
+            self.timer = loop.call_later(self.max_delay, self.on_timer)
+
+    def on_timer(self):
+        self.timer = None
+        self.track(asyncio.ensure_future(self.flush()))
+
+    def track(self, task):
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def submit(self, batch):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        await self.slots.acquire()
+        self.track(asyncio.ensure_future(self.write(batch)))
+
+    async def write(self, batch):
+        try:
+            await self.send(batch)
+        except Exception as e:
+            self.record(batch, e)
+        else:
+            self.record(batch)
+        finally:
+            self.slots.release()
+
+    async def flush(self):
+        """ Send the current batch now. """
+        batch = self.take()
+        if batch:
+            await self.submit(batch)
+
+    async def close(self):
+        await self.flush()
+        while self.tasks:
+            await asyncio.wait(list(self.tasks))
+
+
+class AuthRequest(object):
+    """ The adapter and headers of a request for an auth to update. """
+
+    __slots__ = 'adapter', 'headers'
+
+    def __init__(self, adapter, headers):
+        self.adapter = adapter
+        self.headers = headers
+
+
 class LoginAuth(object):
     """ Auth where you need to perform an arbitrary "login" to get a cookie.
     The expectation is that the args to this constructor can be used to
     perform a request that generates the required cookie(s) for a valid
-    session. """
+    session.
+
+    The login uses the adapter's session and `request_timeout` and only one
+    runs at a time; requests made meanwhile wait for it and share its
+    cookies.  With `ttl`
+    the login is renewed in the background once it is that many seconds
+    old while requests carry on with the current cookies.  A 401 response
+    triggers a new login and one retry of the request. """
 
     content_type = 'application/json'
     OK_HTTP_CODES = 200, 201
 
-    def __init__(self, url, method='POST', **kwargs):
+    def __init__(self, url, method='POST', ttl=None, **kwargs):
         headers = {
             'content-type': self.content_type
         }
@@ -115,20 +622,55 @@ class LoginAuth(object):
             kwargs['data'] = self.serializer(kwargs.pop('data'))
         self.url = url
         self.method = method
+        self.ttl = ttl
         self.req_kwargs = kwargs
         self.login = None
+        self.cookie = None
+        self.expires = None
 
     async def __call__(self, request):
-        if not self.login:
-            with aiohttp.ClientSession() as http:
-                self.login = http.request(self.method, self.url,
-                                          **self.req_kwargs)
-        response = await self.login
-        self.check_login_response()
-        request.headers['cookie'] = response.headers['set-cookie']
-
-    def check_login_response(self):
-        if self.login.result().code not in self.OK_HTTP_CODES:
+        if self.cookie is None:
+            await self.renew(request.adapter, None)
+        elif self.expires is not None and time.monotonic() >= self.expires:
+            self.start_login(request.adapter)
+        request.headers['cookie'] = self.cookie
+
+    async def unauthorized(self, adapter, headers):
+        await self.renew(adapter, headers.get('cookie'))
+        return True
+
+    async def renew(self, adapter, stale):
+        """ Login unless it was already renewed since `stale` was used. """
+        if self.cookie is None or self.cookie == stale:
+            # Shielded so a cancelled caller doesn't cancel it for the others.
+            await asyncio.shield(self.start_login(adapter))
+
+    def start_login(self, adapter):
+        if self.login is None:
+            self.login = asyncio.ensure_future(self.do_login(adapter))
+            # Background renewals may fail unobserved; the next one retries.
+            self.login.add_done_callback(lambda f: f.cancelled() or
+                                         f.exception())
+        return self.login
+
+    async def do_login(self, adapter):
+        try:
+            response = await asyncio.wait_for(
+                adapter.open(self.method, self.url, **self.req_kwargs),
+                adapter.request_timeout)
+            try:
+                self.check_login_response(response)
+                self.cookie = '; '.join('%s=%s' % (k, x.value) for k, x in
+                                        response.cookies.items())
+            finally:
+                response.release()
+            if self.ttl is not None:
+                self.expires = time.monotonic() + self.ttl
+        finally:
+            self.login = None
+
+    def check_login_response(self, response):
+        if response.status not in self.OK_HTTP_CODES:
             raise Exception('login failed')
 
     def serializer(self, data):
@@ -151,17 +693,62 @@ class HeaderAuth(object):
 
 
 class AioPager(base.AdapterPager):
+    """ Page through a resource by following `meta['next']`.  Pages are
+    fetched one at a time but with `prefetch` > 0 the next page is requested
+    as soon as the previous one lands, so up to `prefetch` pages are buffered
+    ahead of the one being consumed.
+
+    The preferred interface is `async for item in pager` or, for whole
+    pages, `async for page in pager.iter_pages()`.  The legacy interface of
+    `await next(pager)` is still supported; it raises StopAsyncIteration
+    once the resource is exhausted.  Don't mix the two on one pager. """
 
     max_overflow = 1000
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.mark = 0
         self.active = None
+        self.pages = collections.deque()
+        self.cursor = 0
         self.waiting = collections.deque()
         self.stop = False
         self.next_page = None
 
+    def __aiter__(self):
+        return self.iter_items()
+
+    async def iter_items(self):
+        async for page in self.iter_pages():
+            for x in page:
+                yield x
+
+    async def fetch_next(self, prev):
+        page = await prev
+        if page is None or not page.meta['next']:
+            return None
+        return await self.getter(urn=page.meta['next'])
+
+    async def iter_pages(self):
+        """ Yield each page as a `ListResponse`. """
+        tail = asyncio.ensure_future(self.getter(*self.path, **self.kwargs))
+        pending = collections.deque([tail])
+        try:
+            while pending:
+                page = await pending.popleft()
+                if page is None:
+                    break
+                more = bool(page.meta['next'])
+                while more and len(pending) < self.prefetch:
+                    tail = asyncio.ensure_future(self.fetch_next(tail))
+                    pending.append(tail)
+                yield page
+                if more and not pending:
+                    tail = asyncio.ensure_future(self.fetch_next(tail))
+                    pending.append(tail)
+        finally:
+            for x in pending:
+                x.cancel()
+
     def __iter__(self):
         return self
 
@@ -174,40 +761,110 @@ class AioPager(base.AdapterPager):
 
     def queue_next_page(self):
         if self.next_page:
-            self.active = self.getter(urn=self.next_page)
+            coro = self.getter(urn=self.next_page)
         else:
-            self.active = self.getter(*self.path, **self.kwargs)
+            coro = self.getter(*self.path, **self.kwargs)
+        self.active = asyncio.ensure_future(coro)
         self.active.add_done_callback(self.on_next_page)
 
+    def fill(self):
+        """ Keep the read-ahead buffer topped up. """
+        if self.active is None and not self.stop and \
+           len(self.pages) <= self.prefetch:
+            self.queue_next_page()
+
+    def drain(self):
+        while self.waiting and self.pages:
+            page = self.pages[0]
+            self.waiting.popleft().set_result(page[self.cursor])
+            self.cursor += 1
+            if self.cursor == len(page):
+                self.pages.popleft()
+                self.cursor = 0
+
     def queue_next(self, item):
         if len(self.waiting) >= self.max_overflow:
             raise OverflowError('max overflow exceeded')
-        if self.active:
-            if self.active.done():
-                if self.active.result():
-                    item.set_result(self.active.result().pop(0))
-                elif self.stop:
-                    raise StopIteration()
-                else:
-                    self.waiting.append(item)
-                    self.queue_next_page()
-            else:
-                self.waiting.append(item)
+        if not self.waiting and self.pages:
+            self.waiting.append(item)
+            self.drain()
+        elif self.stop and self.active is None:
+            item.set_exception(StopAsyncIteration())
         else:
             self.waiting.append(item)
-            self.queue_next_page()
+        self.fill()
 
     def on_next_page(self, page):
+        self.active = None
+        exc = page.exception()
+        if exc is not None:
+            self.stop = True
+            while self.waiting:
+                self.waiting.popleft().set_exception(exc)
+            return
         res = page.result()
         self.next_page = res.meta['next']
         self.stop = not self.next_page
-        while self.waiting and res:
-            self.waiting.popleft().set_result(res.pop(0))
-        if self.waiting:
-            if self.stop:
-                while self.waiting:
-                    self.waiting.popleft().set_exception(StopIteration())
-            else:
-                self.queue_next_page()
+        if res:
+            self.pages.append(res)
+        self.drain()
+        self.fill()
+        if self.waiting and self.stop and self.active is None:
+            while self.waiting:
+                self.waiting.popleft().set_exception(StopAsyncIteration())
+
+
+class AioFanoutPager(base.AdapterFanoutPager):
+    """ Fetch every page after the first with concurrent tasks.  Use with
+    `async for` or `iter_pages()`. """
+
+    def __aiter__(self):
+        return self.iter_items()
+
+    async def iter_items(self):
+        async for page in self.iter_pages():
+            for x in page:
+                yield x
+
+    async def iter_pages(self):
+        """ Yield each page as a `ListResponse`. """
+        page = await self.getter(*self.path, **self.kwargs)
+        yield page
+        offsets = self.remaining_offsets(page)
+        if offsets is None:
+            while page.meta['next']:
+                page = await self.getter(urn=page.meta['next'])
+                yield page
+            return
+        async for page in self.fan_out(offsets):
+            yield page
+
+    async def fan_out(self, offsets):
+        offsets = iter(offsets)
+        pending = collections.deque()
+
+        def submit():
+            for offset in offsets:
+                pending.append(asyncio.ensure_future(self.get_offset(offset)))
+                break
+
+        try:
+            for i in range(self.concurrency):
+                submit()
+            while pending:
+                if self.ordered:
+                    done = [pending.popleft()]
+                    await done[0]
+                else:
+                    done, _ = await asyncio.wait(pending,
+                        return_when=asyncio.FIRST_COMPLETED)
+                    for x in done:
+                        pending.remove(x)
+                for x in done:
+                    submit()
+                    yield x.result()
+        finally:
+            for x in pending:
+                x.cancel()
 
 pager_class = AioPager  # For public reference
@@ -4,21 +4,406 @@ should find its way here.
 """
 
 import collections
+import email.utils
+import random
+import threading
+import time
+import urllib.parse
+from syndicate import compression as m_compression
+from syndicate import data as m_data
+from syndicate import stats as m_stats
 
 Response = collections.namedtuple('Response', ('http_code', 'headers',
                                   'content', 'error', 'extra'))
 
+# The result of one call of a batch; exactly one of `data` or `error` is set.
+Outcome = collections.namedtuple('Outcome', ('key', 'data', 'error'))
+
+# Seconds spent by a request in one phase of its lifecycle.  The phases are
+# queue, dns, connect, ttfb, read, decode, filter and callback.
+Timing = collections.namedtuple('Timing', ('phase', 'method', 'url',
+                                'elapsed'))
+
+
+class ServiceError(Exception):
+    pass
+
+
+class CircuitOpenError(ServiceError):
+    """ The circuit breaker is open so the request was not attempted. """
+
+    def __init__(self, breaker):
+        self.breaker = breaker
+        super().__init__()
+
+    def __str__(self):
+        return '%s(%s)' % (type(self).__name__, self.breaker.state)
+
+
+class TokenBucket(object):
+    """ Allow `rate` events per second with bursts of up to `burst`. """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError('rate must be > 0')
+        self.rate = rate
+        self.capacity = burst or 1
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """ Take a token and return the number of seconds to wait before it
+        may be used.  Tokens can be overdrawn, which queues the callers. """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+
+class Limiter(object):
+    """ Client side pacing of requests.  At most `max_per_host` requests are
+    in flight per host and no more than `rate` requests per second are sent
+    overall.  Subclasses implement `acquire` and `release` for their
+    concurrency model. """
+
+    def __init__(self, max_per_host=None, rate=None, burst=None):
+        self.max_per_host = max_per_host
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.queued = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.total_wait = 0
+
+    def host(self, url):
+        return urllib.parse.urlsplit(url).netloc
+
+    def stats(self):
+        return {
+            "queued": self.queued,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "total_wait": self.total_wait,
+            "mean_wait": self.total_wait / self.requests if self.requests
+                         else 0
+        }
+
+
+class RetryPolicy(object):
+    """ When and how long to wait before retrying a failed request.
+
+    Requests using one of `methods` (the idempotent ones by default) are
+    retried up to `attempts` total attempts if they fail with a connection
+    error or one of the HTTP `statuses`.  The wait is exponential from
+    `backoff` seconds up to `max_backoff` with full jitter, unless the
+    response has a `Retry-After` header.  A `Retry-After` longer than
+    `max_backoff` is not waited for; the response is returned instead.  No
+    retry is started more than `deadline` seconds after the first attempt
+    started, though it may finish later. """
+
+    idempotent_methods = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT',
+                                    'DELETE'))
+    retry_statuses = frozenset((429, 502, 503, 504))
+
+    def __init__(self, attempts=3, statuses=None, methods=None, backoff=0.1,
+                 max_backoff=10, deadline=None):
+        self.attempts = attempts
+        if statuses is None:
+            statuses = self.retry_statuses
+        if methods is None:
+            methods = self.idempotent_methods
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(x.upper() for x in methods)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+
+    def retry_after(self, headers):
+        value = headers and headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = email.utils.parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max(0, when.timestamp() - time.time())
+
+    def delay(self, method, attempt, started, status=None, error=None,
+              headers=None):
+        """ Seconds to wait before retrying or None to give up.  `attempt`
+        counts from 0 and `started` is the `time.monotonic()` of the first
+        attempt. """
+        if method.upper() not in self.methods or \
+           attempt + 1 >= self.attempts:
+            return None
+        if error is None and status not in self.statuses:
+            return None
+        delay = self.retry_after(headers)
+        if delay is None:
+            cap = min(self.max_backoff, self.backoff * 2 ** attempt)
+            delay = random.uniform(0, cap)
+        elif delay > self.max_backoff:
+            return None
+        if self.deadline is not None and \
+           time.monotonic() - started + delay > self.deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker(object):
+    """ Fail fast while an upstream is unhealthy.
+
+    The breaker is closed (requests flow) until, over the last `window`
+    seconds and at least `min_requests` requests, the fraction of failed
+    requests reaches `threshold`.  Errors, 5xx responses and responses
+    slower than `slow` seconds count as failures.  It then opens and every
+    request raises CircuitOpenError for `cooldown` seconds, after which it
+    is half-open: one request is let through as a probe which closes the
+    breaker if it succeeds and opens it again if it fails.  Outcomes of
+    requests allowed before the last change of state are ignored. """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=0.5, window=30, min_requests=10, slow=None,
+                 cooldown=5):
+        self.threshold = threshold
+        self.window = window
+        self.min_requests = min_requests
+        self.slow = slow
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened = None
+        self.probing = False
+        # Bumped with every change of state to tell stale outcomes apart.
+        self.generation = 0
+        self.outcomes = collections.deque()
+        self.failures = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """ Raise CircuitOpenError unless a request may be attempted.
+        Returns a ticket to pass to `record` with the request's outcome. """
+        with self.lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened < self.cooldown:
+                    self.rejected += 1
+                    raise CircuitOpenError(self)
+                self.state = self.HALF_OPEN
+                self.generation += 1
+            if self.state == self.HALF_OPEN:
+                if self.probing:
+                    self.rejected += 1
+                    raise CircuitOpenError(self)
+                self.probing = True
+            return self.generation
+
+    def record(self, elapsed, failed, ticket=None):
+        """ Record the outcome of an allowed request.  Use None for `failed`
+        when the request ended without a verdict, e.g. it was cancelled.
+        Without the `ticket` from `allow` the outcome is taken to be of the
+        current state. """
+        if failed is not None and self.slow is not None and \
+           elapsed > self.slow:
+            failed = True
+        with self.lock:
+            if ticket is not None and ticket != self.generation:
+                return
+            if self.state == self.HALF_OPEN and self.probing:
+                self.probing = False
+                if failed:
+                    self.trip()
+                elif failed is not None:
+                    self.reset()
+                return
+            if failed is None:
+                return
+            now = time.monotonic()
+            self.outcomes.append((now, failed))
+            self.failures += failed
+            while self.outcomes and now - self.outcomes[0][0] > self.window:
+                self.failures -= self.outcomes.popleft()[1]
+            if self.state == self.CLOSED and \
+               len(self.outcomes) >= self.min_requests and \
+               self.failures / len(self.outcomes) >= self.threshold:
+                self.trip()
+
+    def trip(self):
+        self.state = self.OPEN
+        self.generation += 1
+        self.opened = time.monotonic()
+        self.outcomes.clear()
+        self.failures = 0
+
+    def reset(self):
+        self.state = self.CLOSED
+        self.generation += 1
+        self.opened = None
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "requests": len(self.outcomes),
+            "failures": self.failures,
+            "rejected": self.rejected
+        }
+
+
+class PoolRegistry(object):
+    """ Connection pools shared by the adapters of every `Service` in a
+    process that opts in, keyed by scheme, host and port.  Pools hold up to
+    `size(key)` connections, which is `default_size` unless set for a host
+    with `set_size`.  Resolved addresses are cached for `dns_ttl` seconds
+    where the adapter supports it. """
+
+    default_ports = {'http': 80, 'https': 443}
+
+    def __init__(self, default_size=10, dns_ttl=300):
+        self.default_size = default_size
+        self.dns_ttl = dns_ttl
+        self.sizes = {}
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def key(self, url):
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        return scheme, parts.hostname, \
+            parts.port or self.default_ports.get(scheme)
+
+    def set_size(self, url, size):
+        """ Pool size for the host of `url`; applies to pools made later. """
+        self.sizes[self.key(url)] = size
+
+    def size(self, key):
+        return self.sizes.get(key, self.default_size)
+
+    def get(self, kind, url, factory, usable=None):
+        """ The pool of type `kind` for the host of `url`, made with
+        `factory(key)` unless there is one that is `usable(pool)`. """
+        key = self.key(url)
+        with self.lock:
+            pool = self.pools.get((kind, key))
+            if pool is None or (usable is not None and not usable(pool)):
+                pool = self.pools[kind, key] = factory(key)
+            return pool
+
+    def clear(self):
+        """ Forget all pools and return them so they can be closed. """
+        with self.lock:
+            pools = list(self.pools.values())
+            self.pools.clear()
+        return pools
+
+
+# The process wide registry used by `Service(shared_pool=True)`.
+pools = PoolRegistry()
+
 
 class AdapterBase(object):
     """ Adapter interface.  Must subclass. """
 
+    limiter_class = None
+    retry_exceptions = ()
+
     def __init__(self, connect_timeout=None, request_timeout=None,
-                 serializer=None, auth=None, ingress_filter=None):
+                 serializer=None, auth=None, ingress_filter=None,
+                 decoders=None, cache=None, max_per_host=None, rate=None,
+                 burst=None, retry=None, breaker=None, metrics=None,
+                 compress=None):
         self.connect_timeout = connect_timeout
         self.request_timeout = request_timeout
         self.serializer = serializer
         self.auth = auth
         self.ingress_filter = ingress_filter
+        self.decoders = decoders or {}
+        self.cache = cache
+        if max_per_host or rate:
+            self.limiter = self.limiter_class(max_per_host, rate, burst)
+        else:
+            self.limiter = None
+        if retry is True:
+            retry = RetryPolicy()
+        self.retry = retry
+        if breaker is True:
+            breaker = CircuitBreaker()
+        self.breaker = breaker
+        if metrics is True:
+            metrics = m_stats.StatsRegistry()
+        self.metrics = metrics
+        if compress is True:
+            compress = m_compression.Compression()
+        self.compress = compress
+        # Replaced rather than mutated so emitters need no lock.
+        self.listeners = ()
+
+    def subscribe(self, listener):
+        """ Call `listener` with a `Timing` for each request phase. """
+        self.listeners += (listener,)
+
+    def unsubscribe(self, listener):
+        self.listeners = tuple(x for x in self.listeners if x != listener)
+
+    def emit(self, phase, method, url, mark):
+        """ Send the time since the `time.perf_counter` value `mark` to the
+        listeners and return a new mark for the next phase.  Callers only
+        take a mark when there are listeners, e.g.
+        `mark = self.listeners and time.perf_counter()`. """
+        now = time.perf_counter()
+        self.notify(phase, method, url, now - mark)
+        return now
+
+    def notify(self, phase, method, url, elapsed):
+        event = Timing(phase, method, url, elapsed)
+        for x in self.listeners:
+            x(event)
+
+    def retry_delay(self, method, attempt, started, **outcome):
+        """ Seconds to wait before retrying a request or None if it should
+        not be retried. """
+        if self.retry is None:
+            return None
+        return self.retry.delay(method, attempt, started, **outcome)
+
+    def decoder(self, content_type=None):
+        """ The serializer matching a content type, falling back to the
+        default serializer. """
+        if content_type and self.decoders:
+            mime = content_type.split(';', 1)[0].strip().lower()
+            return self.decoders.get(mime, self.serializer)
+        return self.serializer
+
+    def decode(self, body, content_type=None):
+        """ Decode a response body with the serializer matching its content
+        type. """
+        return decode_with(self.decoder(content_type), body)
+
+    def compressed(self, method, data, headers=None):
+        """ An encoded request body as bytes and its headers, compressed if
+        the `compress` policy applies to it. """
+        if isinstance(data, str):
+            data = data.encode()
+        if not self.compress or not self.compress.applies(method, data):
+            return data, headers
+        data, extra = self.compress.encode(data)
+        if extra:
+            headers = dict(headers or {}, **extra)
+        return data, headers
+
+    def record_compression(self, headers, wire_size, body):
+        """ Count a response body that was received compressed. """
+        if wire_size and body and \
+           headers.get('content-encoding', 'identity') != 'identity':
+            self.compress.record('responses', len(body), wire_size)
 
     def set_header(self, header, value):
         """ Set a header that will be included in every HTTP request. """
@@ -39,15 +424,155 @@ class AdapterBase(object):
     def request(self, method, url, data=None, callback=None, query=None):
         raise NotImplementedError('pure virtual method')
 
+    def gather_outcomes(self, calls, concurrency, expand=None):
+        """ Run `(key, fn)` calls, at most `concurrency` at a time, and
+        return an Outcome for each in call order.  Errors are captured in
+        the outcome instead of raised.  `expand` may replace each outcome
+        with a sequence of outcomes. """
+        raise NotImplementedError('pure virtual method')
+
+    def iter_outcomes(self, calls, concurrency, expand=None):
+        """ Like `gather_outcomes` but produce outcomes as they complete. """
+        raise NotImplementedError('pure virtual method')
+
+    def bulk_writer(self, send, **options):
+        """ Return a BulkWriterBase subclass suited to this adapter. """
+        raise NotImplementedError('pure virtual method')
+
+    def warmup(self, url, connections):
+        """ Open up to `connections` connections to the host of `url` ahead
+        of traffic.  Returns how many requests to `url` succeeded. """
+        raise NotImplementedError('pure virtual method')
+
+    def cache_lookup(self, method, url, query):
+        """ Return the cache key and any cached entry for a request.  The key
+        is None for requests that are not cacheable. """
+        if self.cache is None or method.lower() != 'get':
+            return None, None
+        key = self.cache.key(url, query)
+        return key, self.cache.get(key)
+
+    def cache_filter(self, key, entry, response):
+        """ Ingress filter for cacheable requests.  Serves the cached entry
+        on a 304 and caches successful responses. """
+        if entry is not None and response.http_code == 304:
+            return self.cache.revalidate(key, entry)
+        self.cache.miss()
+        data = self.ingress_filter(response)
+        if response.http_code == 200:
+            self.cache.store(key, data, response.headers)
+        return data
+
+    def stream(self, method, url, parser, query=None, timeout=None,
+               meta_key='meta'):
+        """ Perform a request whose response records are produced as they
+        are decoded by `parser`, a `data.JSONListParser`. """
+        raise NotImplementedError('pure virtual method')
+
+
+def decode_with(serializer, body):
+    """ Decode a response body with a serializer or the name of one.  Names
+    are used to decode in other processes as serializers can't be pickled. """
+    serializer = m_data.get_serializer(serializer)
+    if not getattr(serializer, 'raw', False):
+        body = body.decode()
+    return serializer.decode(body)
+
+
+class BulkWriterBase(object):
+    """ Buffer objects and write them in batches with `send(batch)`.
+
+    A batch is sent once it holds `max_objects` objects, `max_bytes` of
+    encoded objects or when its first object has waited `max_delay` seconds.
+    At most `max_in_flight` batches are sent at once; adding objects blocks
+    while that many are pending.  Every object of a failed batch is recorded
+    in `failures` as an `(object, error)` pair. """
+
+    def __init__(self, send, encode=None, max_objects=100, max_bytes=None,
+                 max_delay=None, max_in_flight=2):
+        if max_bytes and encode is None:
+            raise TypeError('max_bytes requires encode')
+        self.send = send
+        self.encode = encode
+        self.max_objects = max_objects
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.max_in_flight = max_in_flight
+        self.batch = []
+        self.batch_bytes = 0
+        self.failures = []
+        self.written = 0
+        self.batches = 0
+
+    def queue(self, obj):
+        """ Add an object to the current batch and return the batch if it
+        should be sent now. """
+        self.batch.append(obj)
+        if self.max_bytes:
+            self.batch_bytes += len(self.encode(obj))
+            if self.batch_bytes >= self.max_bytes:
+                return self.take()
+        if len(self.batch) >= self.max_objects:
+            return self.take()
+
+    def take(self):
+        batch = self.batch
+        self.batch = []
+        self.batch_bytes = 0
+        return batch
+
+    def record(self, batch, error=None):
+        self.batches += 1
+        if error is None:
+            self.written += len(batch)
+        else:
+            self.failures.extend((x, error) for x in batch)
+
 
 class AdapterPager(object):
-    """ A sized generator that iterators over API pages. """
+    """ A sized generator that iterators over API pages.  The `prefetch`
+    argument is the number of pages that may be loaded ahead of the page
+    currently being consumed. """
 
-    def __init__(self, getter, path, kwargs):
+    def __init__(self, getter, path, kwargs, prefetch=0):
+        if prefetch < 0:
+            raise ValueError('prefetch must be >= 0')
         self.getter = getter
         self.path = path
         self.kwargs = kwargs
+        self.prefetch = prefetch
         super().__init__()
 
     def __len__(self):
         raise NotImplementedError("pure virtual")
+
+    def get_offset(self, offset):
+        """ Fetch the page starting at `offset` directly. """
+        return self.getter(*self.path, **dict(self.kwargs, offset=offset))
+
+    def remaining_offsets(self, first):
+        """ Offsets of every page after `first` or None if the listing does
+        not report enough meta data to compute them. """
+        meta = first.meta or {}
+        total = meta.get('total_count')
+        if total is None:
+            return None
+        limit = int(meta.get('limit') or self.kwargs.get('limit') or 0)
+        offset = int(meta.get('offset') or self.kwargs.get('offset') or 0)
+        if not limit:
+            return range(0)
+        return range(offset + limit, int(total), limit)
+
+
+class AdapterFanoutPager(AdapterPager):
+    """ A pager that uses the `total_count` of the first page to compute the
+    offset of every other page so they can be fetched concurrently.  Pages
+    are produced in order unless `ordered` is False, in which case they are
+    produced as they complete. """
+
+    def __init__(self, *args, concurrency=4, ordered=True, **kwargs):
+        if concurrency < 1:
+            raise ValueError('concurrency must be >= 1')
+        self.concurrency = concurrency
+        self.ordered = ordered
+        super().__init__(*args, **kwargs)
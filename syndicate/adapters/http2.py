@@ -0,0 +1,118 @@
+"""
+Asyncronous HTTP/2 adapter using `httpx`.  Concurrent requests to a host
+are multiplexed over a few connections instead of one connection each.
+
+Requires httpx with HTTP/2 support: pip install syndicate[http2]
+"""
+
+import asyncio
+import http.cookies
+import time
+from syndicate.adapters import aio
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class Http2Response(object):
+    """ An `httpx.Response` with the parts of the `aiohttp.ClientResponse`
+    interface used by the aio adapter. """
+
+    def __init__(self, response):
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        self.content = self
+
+    @property
+    def cookies(self):
+        cookies = http.cookies.SimpleCookie()
+        for name, value in self.response.cookies.items():
+            cookies[name] = value
+        return cookies
+
+    async def read(self):
+        return await self.response.aread()
+
+    @property
+    def total_raw_bytes(self):
+        return self.response.num_bytes_downloaded
+
+    def iter_chunked(self, size):
+        return self.response.aiter_bytes(size)
+
+    def release(self):
+        if not self.response.is_closed:
+            asyncio.ensure_future(self.response.aclose())
+
+
+class Http2Adapter(aio.AioAdapter):
+    """ The aio adapter on an HTTP/2 capable `httpx.AsyncClient`.  HTTP/2 is
+    negotiated over TLS; use `connector_config={"http1": False}` to speak it
+    to plain http:// URLs.  `connector_config` is passed to the
+    `httpx.AsyncHTTPTransport` and `session_config` to the client. """
+
+    if httpx is not None:
+        retry_exceptions = httpx.TransportError, asyncio.TimeoutError
+
+    def __init__(self, *args, **kwargs):
+        if httpx is None:
+            raise RuntimeError('The http2 adapter requires httpx: '
+                               'pip install syndicate[http2]')
+        super().__init__(*args, **kwargs)
+
+    def make_session(self, session_config, connector_config, pools,
+                     pool_url):
+        config = dict({"http2": True}, **(connector_config or {}))
+        if pools is not None:
+            transport = pools.get(('http2', self.loop), pool_url,
+                                  lambda key: httpx.AsyncHTTPTransport(
+                                      limits=httpx.Limits(
+                                          max_connections=pools.size(key)),
+                                      **config))
+        else:
+            transport = httpx.AsyncHTTPTransport(**config)
+        self.owns_transport = pools is None
+        timeout = httpx.Timeout(None, connect=self.connect_timeout)
+        return httpx.AsyncClient(transport=transport, timeout=timeout,
+                                 **(session_config or {}))
+
+    def set_cookie(self, cookie, value):
+        self.session.cookies.set(cookie, value)
+
+    def get_cookie(self, cookie):
+        value = self.session.cookies.get(cookie)
+        if value is None:
+            raise KeyError(cookie)
+        return value
+
+    async def open(self, method, url, data=None, params=None, headers=None):
+        request = self.session.build_request(method, url, content=data,
+                                             params=params, headers=headers)
+        if self.listeners:
+            request.extensions['trace'] = self.make_trace(method, url)
+        return Http2Response(await self.session.send(request, stream=True))
+
+    def make_trace(self, method, url):
+        """ An httpcore trace callback that emits the connect time of a new
+        connection, which includes the DNS lookup and TLS handshake, and the
+        time to the first byte. """
+        state = {}
+
+        async def trace(name, info):
+            if name == 'connection.connect_tcp.started':
+                state['connect'] = time.perf_counter()
+            elif name.endswith('.send_request_headers.started'):
+                if 'connect' in state:
+                    self.emit('connect', method, url, state.pop('connect'))
+                state['ttfb'] = time.perf_counter()
+            elif name.endswith('.receive_response_headers.complete'):
+                self.emit('ttfb', method, url, state['ttfb'])
+        return trace
+
+    async def close(self):
+        # Closing the client closes its transport, which may be shared.
+        if self.owns_transport:
+            await self.session.aclose()
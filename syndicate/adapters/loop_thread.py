@@ -0,0 +1,116 @@
+"""
+Blocking adapter that runs the aio adapter on an event loop in a background
+thread, so sync code gets connection multiplexing without a thread per
+request.
+"""
+
+import asyncio
+import threading
+from syndicate import data as m_data
+from syndicate.adapters import aio as aio_adapter
+from syndicate.adapters import requests as requests_adapter
+
+
+class LoopThreadAdapter(object):
+    """ Blocking interface to an `AioAdapter` running on its own event loop
+    thread.  Requests may be made from any number of threads and `submit`
+    returns a `concurrent.futures.Future` instead of blocking.  Attributes
+    not defined here, e.g. `metrics` or `subscribe`, are the aio adapter's.
+    Auth objects should be those of the aio adapter. """
+
+    def __init__(self, adapter_class=aio_adapter.AioAdapter, **config):
+        self.adapter_class = adapter_class
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever,
+                                       name='syndicate-loop', daemon=True)
+        self.thread.start()
+        self.aio = self.run(self.make_adapter(config))
+
+    def __getattr__(self, name):
+        if name == 'aio':
+            raise AttributeError(name)
+        return getattr(self.aio, name)
+
+    async def make_adapter(self, config):
+        return self.adapter_class(loop=self.loop, **config)
+
+    def run(self, coro):
+        """ Run a coroutine on the loop and wait for its result. """
+        if threading.current_thread() is self.thread:
+            coro.close()
+            raise RuntimeError('Blocking call made from the adapter loop')
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def call(self, fn, *args):
+        """ Call a function on the loop and wait for its result. """
+        async def wrapper():
+            return fn(*args)
+        return self.run(wrapper())
+
+    def set_header(self, header, value):
+        self.call(self.aio.set_header, header, value)
+
+    def set_cookie(self, cookie, value):
+        self.call(self.aio.set_cookie, cookie, value)
+
+    def get_cookie(self, cookie):
+        return self.call(self.aio.get_cookie, cookie)
+
+    def submit(self, method, url, data=None, query=None, timeout=None):
+        """ Start a request and return a `concurrent.futures.Future` of its
+        result. """
+        return asyncio.run_coroutine_threadsafe(
+            self.aio.request(method, url, data=data, query=query,
+                             timeout=timeout), self.loop)
+
+    def request(self, method, url, data=None, query=None, callback=None,
+                timeout=None):
+        result = self.submit(method, url, data, query, timeout).result()
+        if callback is not None:
+            callback(result)
+        return result
+
+    def stream(self, method, url, parser, query=None, timeout=None,
+               meta_key='meta', chunk_size=65536):
+        result = self.run(self.aio.stream(method, url, parser, query=query,
+                                          timeout=timeout, meta_key=meta_key,
+                                          chunk_size=chunk_size))
+        if not isinstance(result, aio_adapter.AioListStream):
+            return result
+        closer = result.closer
+        return m_data.ListStream(self.iter_chunks(result.chunks), parser,
+                                 meta_key=meta_key,
+                                 close=lambda: self.call(closer))
+
+    def iter_chunks(self, chunks):
+        async def next_chunk():
+            return await chunks.__anext__()
+        while True:
+            try:
+                yield self.run(next_chunk())
+            except StopAsyncIteration:
+                return
+
+    # Pagers, batches and bulk writes only need a blocking getter or sender
+    # and threads that mostly wait on the loop, as in the requests adapter.
+    get_pager = requests_adapter.RequestsAdapter.get_pager
+    call_outcome = requests_adapter.RequestsAdapter.call_outcome
+    gather_outcomes = requests_adapter.RequestsAdapter.gather_outcomes
+    iter_outcomes = requests_adapter.RequestsAdapter.iter_outcomes
+    bulk_writer = requests_adapter.RequestsAdapter.bulk_writer
+
+    def ensure_pool_size(self, size):
+        pass
+
+    def warmup(self, url, connections):
+        return self.run(self.aio.warmup(url, connections))
+
+    def close(self):
+        if not self.loop.is_running():
+            return
+        try:
+            self.run(self.aio.close())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
@@ -2,17 +2,176 @@
 Syncronous adapter based on the 'requests' library.
 """
 
+import collections
+import concurrent.futures
+import functools
 import json
 import requests
+import socket
+import threading
+import time
+import urllib.parse
+import urllib3
+from syndicate import data as m_data
 from syndicate.adapters import base
 
 
+# Adapters may be shared by sessions, so resizing them is serialized.
+pool_resize_lock = threading.Lock()
+
+# The `ConnectTiming` of the request a thread is sending, if it is timed.
+sending = threading.local()
+
+
+class ConnectTiming(object):
+    """ Seconds spent resolving and connecting for one request; None if it
+    used a pooled connection. """
+
+    def __init__(self):
+        self.dns = None
+        self.connect = None
+
+
+class TimedConnectionMixin(object):
+    """ Record DNS and connect (including TLS) times in the `ConnectTiming`
+    of the thread's request, if any. """
+
+    def connect(self):
+        timing = getattr(sending, 'timing', None)
+        if timing is None:
+            return super().connect()
+        start = time.perf_counter()
+        super().connect()
+        timing.connect = time.perf_counter() - start - (timing.dns or 0)
+
+    def _new_conn(self):
+        timing = getattr(sending, 'timing', None)
+        if timing is None:
+            return super()._new_conn()
+        start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(
+                self._dns_host, self.port,
+                urllib3.util.connection.allowed_gai_family(),
+                socket.SOCK_STREAM)
+        except socket.gaierror:
+            # Let urllib3 resolve again and raise its own error.
+            return super()._new_conn()
+        timing.dns = time.perf_counter() - start
+        host = self._dns_host
+        error = None
+        try:
+            # Connect to each resolved address in turn, as urllib3 would.
+            for x in addresses:
+                self._dns_host = x[4][0]
+                try:
+                    return super()._new_conn()
+                except urllib3.exceptions.ConnectTimeoutError as e:
+                    error = e
+        finally:
+            self._dns_host = host
+        raise error
+
+
+class TimedHTTPConnection(TimedConnectionMixin,
+                          urllib3.connection.HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin,
+                           urllib3.connection.HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(requests.adapters.HTTPAdapter):
+    """ HTTPAdapter whose connections report DNS and connect times. """
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool
+        }
+
+
+class ThreadLimiter(base.Limiter):
+    """ Thread safe request pacing for the requests adapter. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.semaphores = {}
+
+    def acquire(self, url):
+        host = self.host(url)
+        start = time.monotonic()
+        with self.lock:
+            self.queued += 1
+            if self.max_per_host:
+                sem = self.semaphores.get(host)
+                if sem is None:
+                    sem = threading.Semaphore(self.max_per_host)
+                    self.semaphores[host] = sem
+        try:
+            if self.max_per_host:
+                sem.acquire()
+            if self.bucket is not None:
+                try:
+                    delay = self.bucket.reserve()
+                    if delay:
+                        time.sleep(delay)
+                except BaseException:
+                    if self.max_per_host:
+                        sem.release()
+                    raise
+        finally:
+            with self.lock:
+                self.queued -= 1
+        with self.lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.total_wait += time.monotonic() - start
+        return host
+
+    def release(self, host):
+        with self.lock:
+            self.in_flight -= 1
+        if self.max_per_host:
+            self.semaphores[host].release()
+
+
 class RequestsAdapter(base.AdapterBase):
 
-    def __init__(self, session_config=None, **config):
+    limiter_class = ThreadLimiter
+    retry_exceptions = requests.ConnectionError, requests.Timeout
+
+    def __init__(self, session_config=None, pools=None, pool_url=None,
+                 **config):
         self.session = requests.Session(**(session_config or {}))
+        for prefix in ('http://', 'https://'):
+            self.session.adapters.pop(prefix).close()
+            self.session.mount(prefix, TimedHTTPAdapter())
+        if pools is not None:
+            parts = urllib.parse.urlsplit(pool_url)
+            adapter = pools.get('requests', pool_url, functools.partial(
+                self.make_shared_adapter, pools))
+            self.session.mount('%s://%s/' % (parts.scheme, parts.netloc),
+                               adapter)
         super().__init__(**config)
 
+    @staticmethod
+    def make_shared_adapter(pools, key):
+        return TimedHTTPAdapter(pool_connections=1,
+                                pool_maxsize=pools.size(key))
+
     def set_header(self, header, value):
         self.session.headers[header] = value
 
@@ -25,7 +184,11 @@ class RequestsAdapter(base.AdapterBase):
     def get_cookie(self, cookie):
         return self.session.cookies.get_dict()[cookie]
 
-    def get_pager(self, *args, **kwargs):
+    def get_pager(self, *args, concurrency=None, **kwargs):
+        if concurrency:
+            self.ensure_pool_size(concurrency)
+            return RequestsFanoutPager(*args, concurrency=concurrency,
+                                       **kwargs)
         return RequestsPager(*args, **kwargs)
 
     @property
@@ -35,35 +198,307 @@ class RequestsAdapter(base.AdapterBase):
     @auth.setter
     def auth(self, value):
         self.session.auth = value
+        bind = getattr(value, 'bind', None)
+        if bind is not None:
+            bind(self)
 
     def request(self, method, url, data=None, query=None, callback=None,
                 timeout=None):
+        key, entry = self.cache_lookup(method, url, query)
+        if entry is not None and self.cache.is_fresh(entry):
+            data = self.cache.hit(entry)
+            if callback:
+                callback(data)
+            return data
+        headers = entry and entry.validators()
         if data is not None:
-            data = self.serializer.encode(data)
+            data, headers = self.compressed(method,
+                                            self.serializer.encode(data),
+                                            headers)
         if timeout is None:
             timeout = self.connect_timeout, self.request_timeout
-        resp = self.session.request(method, url, data=data, params=query,
-                                    timeout=timeout)
+        resp = self.send(method, url, data=data, params=query,
+                         timeout=timeout, headers=headers)
+        if self.compress and 'content-encoding' in resp.headers:
+            self.record_compression(resp.headers, resp.raw.tell(),
+                                    resp.content)
+        mark = self.listeners and time.perf_counter()
+        response = self.make_response(resp)
+        if mark:
+            mark = self.emit('decode', method, url, mark)
+        if key is not None:
+            data = self.cache_filter(key, entry, response)
+        else:
+            data = self.ingress_filter(response)
+        if mark:
+            mark = self.emit('filter', method, url, mark)
+        if callback:
+            callback(data)
+            if mark:
+                self.emit('callback', method, url, mark)
+        return data
+
+    def send(self, method, url, **kwargs):
+        """ Send a request through the limiter and retry policy, if any. """
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            ticket = self.breaker and self.breaker.allow()
+            host = None
+            failed = None
+            status = 'error'
+            sent = time.monotonic()
+            mark = self.listeners and time.perf_counter()
+            try:
+                if self.limiter:
+                    host = self.limiter.acquire(url)
+                    if mark:
+                        mark = self.emit('queue', method, url, mark)
+                sent = time.monotonic()
+                if mark:
+                    resp = self.timed_request(method, url, mark, **kwargs)
+                else:
+                    resp = self.session.request(method, url, **kwargs)
+            except self.retry_exceptions as e:
+                failed = True
+                delay = self.retry_delay(method, attempt, started, error=e)
+                if delay is None:
+                    raise
+            else:
+                status = resp.status_code
+                failed = status >= 500
+                delay = self.retry_delay(method, attempt, started,
+                                         status=status, headers=resp.headers)
+                if delay is None:
+                    if kwargs.get('stream') and host is not None:
+                        # The body is yet to be streamed; the response
+                        # keeps the limiter slot until it is closed.
+                        resp = HeldResponse(resp, self.limiter, host)
+                        host = None
+                    return resp
+                resp.close()
+            finally:
+                elapsed = time.monotonic() - sent
+                if self.breaker:
+                    self.breaker.record(elapsed, failed, ticket)
+                if self.metrics:
+                    self.record_metrics(method, url, status, elapsed, kwargs,
+                                        resp if status != 'error' else None)
+                if host is not None:
+                    self.limiter.release(host)
+            attempt += 1
+            time.sleep(delay)
+
+    def timed_request(self, method, url, mark, **kwargs):
+        """ `session.request` reporting its dns, connect, ttfb and read times
+        to the listeners.  DNS and connect times are only reported when a
+        new connection is made. """
+        sending.timing = timing = ConnectTiming()
+        try:
+            resp = self.session.request(method, url, **kwargs)
+        finally:
+            sending.timing = None
+        # The elapsed time of requests runs to the response headers and
+        # includes any time spent connecting.
+        elapsed = resp.elapsed.total_seconds()
+        ttfb = elapsed
+        for phase in ('dns', 'connect'):
+            value = getattr(timing, phase)
+            if value is not None:
+                self.notify(phase, method, url, value)
+                ttfb -= value
+        self.notify('ttfb', method, url, ttfb)
+        self.notify('read', method, url, time.perf_counter() - mark - elapsed)
+        return resp
+
+    def record_metrics(self, method, url, status, elapsed, kwargs, resp):
+        # Streamed bodies aren't read yet so their size isn't known.
+        if resp is None or kwargs.get('stream'):
+            bytes_in = 0
+        else:
+            bytes_in = len(resp.content or b'')
+        bytes_out = len(kwargs.get('data') or b'')
+        self.metrics.record(method, url, status, elapsed, bytes_in, bytes_out)
+
+    def ensure_pool_size(self, size):
+        """ Make sure the session keeps enough connections for `size`
+        threads using it at once.  Every mounted adapter, including a host's
+        shared one, is resized in place and its old pools are closed. """
+        with pool_resize_lock:
+            for adapter in self.session.adapters.values():
+                if getattr(adapter, '_pool_maxsize', size) >= size:
+                    continue
+                old = adapter.poolmanager
+                adapter.init_poolmanager(adapter._pool_connections, size,
+                                         block=adapter._pool_block)
+                old.clear()
+
+    def call_outcome(self, key, fn):
+        try:
+            return base.Outcome(key, fn(), None)
+        except Exception as e:
+            return base.Outcome(key, None, e)
+
+    def gather_outcomes(self, calls, concurrency, expand=None):
+        return list(self.iter_outcomes(calls, concurrency, expand,
+                                       ordered=True))
+
+    def iter_outcomes(self, calls, concurrency, expand=None, ordered=False):
+        self.ensure_pool_size(concurrency)
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+            futures = [pool.submit(self.call_outcome, key, fn)
+                       for key, fn in calls]
+            try:
+                done = futures if ordered else \
+                    concurrent.futures.as_completed(futures)
+                for x in done:
+                    outcome = x.result()
+                    yield from expand(outcome) if expand else (outcome,)
+            finally:
+                for x in futures:
+                    x.cancel()
+
+    def bulk_writer(self, send, **options):
+        return RequestsBulkWriter(send, **options)
+
+    def warmup(self, url, connections):
+        # Requests that finish quickly may free a connection for the next,
+        # so fewer than `connections` may be opened against a fast server.
+        self.ensure_pool_size(connections)
+        timeout = self.connect_timeout, self.request_timeout
+
+        def head(i):
+            try:
+                self.session.head(url, timeout=timeout).close()
+            except requests.RequestException:
+                return False
+            return True
+        with concurrent.futures.ThreadPoolExecutor(connections) as pool:
+            return sum(pool.map(head, range(connections)))
+
+    def make_response(self, resp):
         content = None
         try:
             if resp.content:
-                content = self.serializer.decode(resp.content.decode())
+                content = self.decode(resp.content,
+                                      resp.headers.get('content-type'))
         except Exception as e:
             error = e
             content = None
         else:
             error = None
-        r = base.Response(http_code=resp.status_code, headers=resp.headers,
-                          content=content, error=error, extra=resp)
-        data = self.ingress_filter(r)
-        if callback:
-            callback(data)
-        return data
+        return base.Response(http_code=resp.status_code, headers=resp.headers,
+                             content=content, error=error, extra=resp)
+
+    def stream(self, method, url, parser, query=None, timeout=None,
+               meta_key='meta', chunk_size=65536):
+        if timeout is None:
+            timeout = self.connect_timeout, self.request_timeout
+        resp = self.send(method, url, params=query, timeout=timeout,
+                         stream=True)
+        if not resp.ok:
+            try:
+                response = self.make_response(resp)
+            finally:
+                resp.close()
+            return self.ingress_filter(response)
+        return m_data.ListStream(resp.iter_content(chunk_size), parser,
+                                 meta_key=meta_key, close=resp.close)
 
     def close(self):
         pass
 
 
+class HeldResponse(object):
+    """ A response whose body hasn't been read, holding its request's
+    limiter slot until it is closed. """
+
+    def __init__(self, response, limiter, host):
+        self.response = response
+        self.limiter = limiter
+        self.host = host
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def close(self):
+        try:
+            self.response.close()
+        finally:
+            if self.host is not None:
+                self.limiter.release(self.host)
+                self.host = None
+
+
+class RequestsBulkWriter(base.BulkWriterBase):
+    """ Bulk writer that sends batches from a thread pool.  Use it as a
+    context manager or call `close()` to send the final batch and wait. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = concurrent.futures.ThreadPoolExecutor(self.max_in_flight)
+        self.slots = threading.BoundedSemaphore(self.max_in_flight)
+        self.lock = threading.Lock()
+        # Held from taking a batch until it is in the pool, so a timer
+        # flush can't race `close`.
+        self.submitting = threading.RLock()
+        self.timer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def add(self, obj):
+        with self.lock:
+            batch = self.queue(obj)
+            if batch is None and self.max_delay and self.timer is None:
+                self.timer = threading.Timer(self.max_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if batch:
+            self.submit(batch)
+
+    def submit(self, batch):
+        with self.submitting:
+            self.cancel_timer()
+            self.slots.acquire()
+            self.pool.submit(self.write, batch)
+
+    def cancel_timer(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+    def write(self, batch):
+        try:
+            self.send(batch)
+        except Exception as e:
+            error = e
+        else:
+            error = None
+        finally:
+            self.slots.release()
+        with self.lock:
+            self.record(batch, error)
+
+    def flush(self):
+        """ Send the current batch now. """
+        with self.submitting:
+            with self.lock:
+                batch = self.take()
+            if batch:
+                self.submit(batch)
+
+    def close(self):
+        self.cancel_timer()
+        with self.submitting:
+            self.flush()
+            self.pool.shutdown(wait=True)
+
+
 class HeaderAuth(requests.auth.AuthBase):
     """ A simple header based auth.  Instantiate this with header name and
     value arguments for a single header or with a dictionary of name/value
@@ -84,12 +519,20 @@ class LoginAuth(requests.auth.AuthBase):
     """ Auth where you need to perform an arbitrary "login" to get a cookie.
     The expectation is that the args to this constructor can be used to
     perform a request that generates the required cookie(s) for a valid
-    session. """
+    session.
+
+    The login uses the adapter's session and timeouts and only one runs at
+    a time; threads making requests meanwhile wait for it and share its
+    cookies.
+    With `ttl` the login is renewed from a background thread once it is
+    that many seconds old while requests carry on with the current
+    cookies.  A 401 response triggers a new login and one retry of the
+    request. """
 
     content_type = 'application/json'
     OK_HTTP_CODES = 200, 201
 
-    def __init__(self, url, method='POST', **kwargs):
+    def __init__(self, url, method='POST', ttl=None, **kwargs):
         headers = {
             'content-type': self.content_type
         }
@@ -100,17 +543,103 @@ class LoginAuth(requests.auth.AuthBase):
             kwargs['data'] = self.serializer(kwargs['data'])
         self.url = url
         self.method = method
+        self.ttl = ttl
         self.req_kwargs = kwargs
+        self.session = None
+        self.timeout = None
         self.login = None
+        self.cookies = None
+        self.expires = None
+        # A Future of the login in progress, if any.
+        self.pending = None
+        self.lock = threading.Lock()
+        self.renewing = threading.Lock()
+
+    def bind(self, adapter):
+        """ Login with the session of the adapter using this auth. """
+        self.session = adapter.session
+        self.timeout = adapter.connect_timeout, adapter.request_timeout
 
     def __call__(self, request):
-        if not self.login:
-            self.login = requests.request(self.method, self.url,
-                                          **self.req_kwargs)
-        self.check_login_response()
-        request.prepare_cookies(self.login.cookies)
+        cookies = self.cookies
+        if cookies is None:
+            cookies = self.renew(None)
+        elif self.expires is not None and time.monotonic() >= self.expires:
+            self.renew_in_background(cookies)
+        request.prepare_cookies(cookies)
+        request.login_cookies = cookies
+        request.register_hook('response', self.handle_401)
         return request
 
+    def renew(self, stale):
+        """ Login unless it was already renewed since `stale` was used.  The
+        lock is only held to check and publish the cookies; threads that
+        find a login in progress wait for its result. """
+        with self.lock:
+            if self.cookies is not None and self.cookies is not stale:
+                return self.cookies
+            login = self.pending
+            leader = login is None
+            if leader:
+                login = self.pending = concurrent.futures.Future()
+        if not leader:
+            return login.result()
+        try:
+            cookies = self.do_login()
+        except BaseException as e:
+            with self.lock:
+                self.pending = None
+            login.set_exception(e)
+            raise
+        with self.lock:
+            self.cookies = cookies
+            if self.ttl is not None:
+                self.expires = time.monotonic() + self.ttl
+            self.pending = None
+        login.set_result(cookies)
+        return cookies
+
+    def do_login(self):
+        http = self.session or requests
+        kwargs = dict({"timeout": self.timeout}, **self.req_kwargs)
+        # The session's auth is this, so skip it for the login.
+        self.login = http.request(self.method, self.url, auth=lambda r: r,
+                                  **kwargs)
+        self.check_login_response()
+        return self.login.cookies
+
+    def renew_in_background(self, stale):
+        if not self.renewing.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                self.renew(stale)
+            except Exception:
+                pass  # The next request past `expires` tries again.
+            finally:
+                self.renewing.release()
+        threading.Thread(target=run, daemon=True).start()
+
+    def handle_401(self, resp, **kwargs):
+        """ Response hook that logs in again and resends a request refused
+        with a 401, as `requests.auth.HTTPDigestAuth` does. """
+        if resp.status_code != 401 or \
+           getattr(resp.request, 'login_retry', False):
+            return resp
+        cookies = self.renew(getattr(resp.request, 'login_cookies', None))
+        resp.content
+        resp.close()
+        prep = resp.request.copy()
+        prep.login_retry = True
+        prep._cookies.update(cookies)
+        prep.headers.pop('Cookie', None)
+        prep.prepare_cookies(prep._cookies)
+        retry = resp.connection.send(prep, **kwargs)
+        retry.history.append(resp)
+        retry.request = prep
+        return retry
+
     def check_login_response(self):
         if self.login.status_code not in self.OK_HTTP_CODES:
             raise Exception('login failed')
@@ -120,23 +649,66 @@ class LoginAuth(requests.auth.AuthBase):
 
 
 class RequestsPager(base.AdapterPager):
+    """ Iterate a resource by following `meta['next']`.  With `prefetch` > 0
+    a background thread fetches up to that many pages ahead of the page
+    currently being consumed. """
 
     length_unset = object()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.page = None
+        self.cursor = 0
+        self.pool = None
+        self.tail = None
+        self.pending = collections.deque()
 
     def __iter__(self):
         return self
 
+    def set_page(self, page):
+        self.page = page
+        self.cursor = 0
+
     def load_first(self):
-        self.page = self.getter(*self.path, **self.kwargs)
+        self.set_page(self.getter(*self.path, **self.kwargs))
+        if self.prefetch:
+            self.fill()
 
     def load_next(self):
-        if not self.page.meta['next']:
-            raise StopIteration()
-        self.page = self.getter(urn=self.page.meta['next'])
+        if self.prefetch:
+            if not self.pending:
+                self.fill()
+            page = self.pending.popleft().result() if self.pending else None
+            if page is None:
+                self.close()
+                raise StopIteration()
+            self.fill()
+        else:
+            if not self.page.meta['next']:
+                raise StopIteration()
+            page = self.getter(urn=self.page.meta['next'])
+        self.set_page(page)
+
+    def fetch_next(self, prev):
+        """ Worker thread routine that loads the page after `prev`. """
+        page = prev.result()
+        if page is None or not page.meta['next']:
+            return None
+        return self.getter(urn=page.meta['next'])
+
+    def fill(self):
+        """ Queue page loads until `prefetch` pages are loaded or pending. """
+        if self.pool is None:
+            self.pool = concurrent.futures.ThreadPoolExecutor(1)
+            self.tail = concurrent.futures.Future()
+            self.tail.set_result(self.page)
+        while len(self.pending) < self.prefetch:
+            if self.tail.done() and not self.tail.exception() and \
+               self.tail.result() is None:
+                break
+            self.tail = self.pool.submit(self.fetch_next, self.tail)
+            self.pending.append(self.tail)
 
     def __len__(self):
         if self.page is None:
@@ -146,8 +718,90 @@ class RequestsPager(base.AdapterPager):
     def __next__(self):
         if self.page is None:
             self.load_first()
-        if not self.page:
+        while self.cursor >= len(self.page):
             self.load_next()
-        return self.page.pop(0)
+        item = self.page[self.cursor]
+        self.cursor += 1
+        return item
 
     next = __next__
+
+    def close(self):
+        """ Abandon any pages still being prefetched. """
+        while self.pending:
+            self.pending.popleft().cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+
+class RequestsFanoutPager(base.AdapterFanoutPager):
+    """ Fetch every page after the first with a pool of threads. """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.first = None
+        self.items = None
+
+    def __iter__(self):
+        return self
+
+    def load_first(self):
+        self.first = self.getter(*self.path, **self.kwargs)
+
+    def __len__(self):
+        if self.first is None:
+            self.load_first()
+        try:
+            return self.first.meta['total_count']
+        except KeyError:
+            raise TypeError('listing has no total_count') from None
+
+    def __next__(self):
+        if self.items is None:
+            self.items = self.iter_items()
+        return next(self.items)
+
+    next = __next__
+
+    def iter_items(self):
+        if self.first is None:
+            self.load_first()
+        page = self.first
+        yield from page
+        offsets = self.remaining_offsets(page)
+        if offsets is None:
+            while page.meta['next']:
+                page = self.getter(urn=page.meta['next'])
+                yield from page
+            return
+        for page in self.fan_out(offsets):
+            yield from page
+
+    def fan_out(self, offsets):
+        offsets = iter(offsets)
+        pending = collections.deque()
+        pool = concurrent.futures.ThreadPoolExecutor(self.concurrency)
+
+        def submit():
+            for offset in offsets:
+                pending.append(pool.submit(self.get_offset, offset))
+                break
+
+        try:
+            for i in range(self.concurrency):
+                submit()
+            while pending:
+                if self.ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = concurrent.futures.wait(pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for x in done:
+                        pending.remove(x)
+                for x in done:
+                    submit()
+                    yield x.result()
+        finally:
+            for x in pending:
+                x.cancel()
+            pool.shutdown(wait=False)
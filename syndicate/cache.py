@@ -0,0 +1,225 @@
+'''
+Client side caching of GET responses with HTTP revalidation.
+'''
+
+import collections
+import copy
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import urllib.parse
+
+
+def request_key(url, query=None):
+    """ Identity of a request by its URL and normalized query. """
+    if not query:
+        return url
+    return '%s?%s' % (url, urllib.parse.urlencode(sorted(query.items()),
+                                                  doseq=True))
+
+
+def clone(data):
+    """ Deep copy of a response so callers can't mutate a cached one. """
+    return copy.deepcopy(data)
+
+
+class CacheEntry(collections.namedtuple('CacheEntry', ('data', 'etag',
+                                        'last_modified', 'stored'))):
+
+    def validators(self):
+        """ Headers for a conditional request that revalidates this entry. """
+        headers = {}
+        if self.etag:
+            headers['if-none-match'] = self.etag
+        if self.last_modified:
+            headers['if-modified-since'] = self.last_modified
+        return headers
+
+
+class DiskStore(object):
+    """ Entry storage in a directory with a pickle file per entry.  Entries
+    older than `ttl` seconds are deleted and once there are more than
+    `maxsize` the oldest are deleted down to 90% of it. """
+
+    def __init__(self, directory, maxsize=10240, ttl=3600):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.count = self.prune(maxsize)
+
+    def path(self, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def get(self, key):
+        try:
+            with open(self.path(key), 'rb') as f:
+                stored_key, entry = pickle.load(f)
+        except OSError:
+            return None
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError,
+                IndexError, KeyError, TypeError, ValueError):
+            # Truncated, corrupt or written by incompatible code.
+            self.delete(key)
+            return None
+        return entry if stored_key == key else None
+
+    def put(self, key, entry):
+        path = self.path(key)
+        added = not os.path.exists(path)
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((key, entry), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        if added:
+            with self.lock:
+                self.count += 1
+                full = self.count > self.maxsize
+            if full:
+                count = self.prune(self.maxsize - self.maxsize // 10)
+                with self.lock:
+                    self.count = count
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            return
+        with self.lock:
+            self.count -= 1
+
+    def clear(self):
+        for x in os.listdir(self.directory):
+            os.unlink(os.path.join(self.directory, x))
+        with self.lock:
+            self.count = 0
+
+    def prune(self, size):
+        """ Delete expired entries and then the oldest entries beyond `size`.
+        Returns the number of entries left. """
+        files = []
+        expires = time.time() - self.ttl
+        for x in os.scandir(self.directory):
+            try:
+                mtime = x.stat().st_mtime
+                if mtime < expires:
+                    os.unlink(x.path)
+                else:
+                    files.append((mtime, x.path))
+            except FileNotFoundError:
+                pass
+        files.sort()
+        excess = max(len(files) - size, 0)
+        for mtime, path in files[:excess]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        return len(files) - excess
+
+
+class ResponseCache(object):
+    """ An LRU cache of GET responses keyed on the URL and query.
+
+    Entries younger than `fresh` seconds are served without contacting the
+    server.  Older entries are revalidated with `If-None-Match` and/or
+    `If-Modified-Since` and served again if the server replies 304.  Entries
+    are evicted after `ttl` seconds or when more than `maxsize` are held.  If
+    a `directory` is given entries are also stored on disk there, where up
+    to `disk_maxsize` (ten times `maxsize` by default) are kept. """
+
+    def __init__(self, maxsize=1024, ttl=3600, fresh=0, directory=None,
+                 disk_maxsize=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.fresh = fresh
+        if disk_maxsize is None:
+            disk_maxsize = maxsize * 10
+        self.disk = directory and DiskStore(directory, disk_maxsize, ttl)
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def key(self, url, query=None):
+        return request_key(url, query)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None and self.disk:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.add(key, entry)
+        if entry is not None and time.time() - entry.stored > self.ttl:
+            self.delete(key)
+            entry = None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry.stored < self.fresh
+
+    def add(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def store(self, key, data, headers):
+        """ Cache a response if it can be revalidated or served fresh. """
+        if 'no-store' in headers.get('cache-control', ''):
+            return
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if not (etag or last_modified or self.fresh):
+            return
+        entry = CacheEntry(clone(data), etag, last_modified, time.time())
+        self.add(key, entry)
+        if self.disk:
+            self.disk.put(key, entry)
+
+    def miss(self):
+        with self.lock:
+            self.misses += 1
+
+    def hit(self, entry):
+        with self.lock:
+            self.hits += 1
+        return clone(entry.data)
+
+    def revalidate(self, key, entry):
+        """ The server confirmed `entry` is current. """
+        with self.lock:
+            self.revalidated += 1
+        self.add(key, entry._replace(stored=time.time()))
+        return self.hit(entry)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+        if self.disk:
+            self.disk.delete(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+        if self.disk:
+            self.disk.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "size": len(self.entries)
+            }
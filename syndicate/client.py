@@ -2,14 +2,18 @@
 Client for REST APIs.
 '''
 
+import functools
 import re
+from . import cache as m_cache
 from . import data as m_data
 from .adapters import aio as aio_adapter
+from .adapters import base as base_adapter
+from .adapters import http2 as http2_adapter
+from .adapters import loop_thread as loop_thread_adapter
 from .adapters import requests as requests_adapter
 
-
-class ServiceError(Exception):
-    pass
+ServiceError = base_adapter.ServiceError
+CircuitOpenError = base_adapter.CircuitOpenError
 
 
 class ResponseError(ServiceError):
@@ -48,7 +52,8 @@ class Service(object):
 
     def __init__(self, uri=None, urn='', auth=None, serializer='json',
                  data_getter=None, meta_getter=None, trailing_slash=True,
-                 aio=False, **adapter_config):
+                 aio=False, accept=None, cache=None, shared_pool=False,
+                 loop_thread=False, http2=False, **adapter_config):
         if not uri:
             raise TypeError("Required: uri")
         if 'async' in adapter_config:
@@ -61,32 +66,121 @@ class Service(object):
         self.trailing_slash = trailing_slash
         self.uri = uri
         self.urn = urn
+        if cache is True:
+            cache = m_cache.ResponseCache()
+        self.cache = cache
         self.data_getter = data_getter or self.default_data_getter
         self.meta_getter = meta_getter or self.default_meta_getter
-        if hasattr(serializer, 'mime'):
-            self.serializer = serializer
-        else:
-            self.serializer = m_data.serializers[serializer]
+        self.serializer = m_data.get_serializer(serializer)
+        # Response types we will advertise and decode, by preference.
+        self.accept = [self.serializer]
+        for x in accept or ():
+            x = m_data.get_serializer(x)
+            if x.mime not in (s.mime for s in self.accept):
+                self.accept.append(x)
+        decoders = dict((x.mime, x) for x in self.accept)
+        if shared_pool:
+            if shared_pool is True:
+                shared_pool = base_adapter.pools
+            adapter_config['pools'] = shared_pool
+            adapter_config['pool_url'] = uri
         self.adapter = self.make_adapter(ingress_filter=self.ingress_filter,
                                          serializer=self.serializer,
                                          auth=self.auth, aio=aio,
+                                         loop_thread=loop_thread,
+                                         http2=http2,
+                                         decoders=decoders, cache=cache,
                                          **adapter_config)
 
-    def make_adapter(self, aio=False, **config):
+    @property
+    def circuit_state(self):
+        """ State of the adapter's circuit breaker or None if it has none.
+        Suitable for health checks. """
+        breaker = getattr(self.adapter, 'breaker', None)
+        return breaker and breaker.state
+
+    def stats(self):
+        """ A snapshot of the request statistics (with `metrics=True`) and
+        of the cache, limiter, circuit breaker and compression if they are
+        in use. """
+        a = self.adapter
+        stats = {}
+        if a.metrics:
+            stats['requests'] = a.metrics.snapshot()
+        for name, x in (('cache', self.cache), ('limiter', a.limiter),
+                        ('breaker', a.breaker), ('compression', a.compress)):
+            if x:
+                stats[name] = x.stats()
+        return stats
+
+    def stats_text(self):
+        """ Request statistics in the Prometheus text format. """
+        if not self.adapter.metrics:
+            return ''
+        return self.adapter.metrics.exposition()
+
+    def reset_stats(self):
+        if self.adapter.metrics:
+            self.adapter.metrics.reset()
+        if self.adapter.compress:
+            self.adapter.compress.reset()
+
+    def warmup(self, connections=1):
+        """ Open up to `connections` connections to the service ahead of
+        traffic with HEAD requests to its URL.  Returns how many succeeded.
+        """
+        return self.adapter.warmup(self.make_url(()), connections)
+
+    def subscribe(self, listener):
+        """ Call `listener` with an `adapters.base.Timing` for each phase of
+        every request: queue, dns, connect, ttfb, read, decode, filter and
+        callback.  DNS and connect times are reported when a connection is
+        opened; with `http2` the connect time includes the DNS lookup. """
+        self.adapter.subscribe(listener)
+
+    def unsubscribe(self, listener):
+        self.adapter.unsubscribe(listener)
+
+    def make_adapter(self, aio=False, loop_thread=False, http2=False,
+                     **config):
+        """ With `loop_thread` the aio adapter is run on a background event
+        loop thread behind the blocking API of the sync mode.  With `http2`
+        the HTTP/2 adapter is used in aio or `loop_thread` mode. """
         if 'async' in config:
             raise TypeError("Invalid argument: `async` is now reserved; "
                             "Use `aio` instead")
-        Adapter = aio_adapter.AioAdapter if aio else \
-                  requests_adapter.RequestsAdapter
+        if http2 and not (aio or loop_thread):
+            raise TypeError("http2 requires `aio` or `loop_thread`")
+        if loop_thread:
+            Adapter = loop_thread_adapter.LoopThreadAdapter
+            if http2:
+                config['adapter_class'] = http2_adapter.Http2Adapter
+        elif http2:
+            Adapter = http2_adapter.Http2Adapter
+        elif aio:
+            Adapter = aio_adapter.AioAdapter
+        else:
+            Adapter = requests_adapter.RequestsAdapter
         a = Adapter(**config)
-        a.set_header('accept', self.serializer.mime)
+        a.set_header('accept', self.accept_header())
         a.set_header('content-type', self.serializer.mime)
+        accept_encoding = a.compress and a.compress.accept_encoding()
+        if accept_encoding:
+            a.set_header('accept-encoding', accept_encoding)
         return a
 
+    def accept_header(self):
+        mimes = [self.serializer.mime]
+        for i, x in enumerate(self.accept[1:9], 1):
+            mimes.append('%s;q=0.%d' % (x.mime, 10 - i))
+        return ', '.join(mimes)
+
     def ingress_filter(self, response):
         """ Flatten a response with meta and data keys into an object. """
         data = self.data_getter(response)
-        if isinstance(data, dict):
+        if isinstance(data, m_data.DictResponse):
+            pass
+        elif isinstance(data, dict):
             data = m_data.DictResponse(data)
         elif isinstance(data, list):
             data = m_data.ListResponse(data)
@@ -95,8 +189,7 @@ class Service(object):
         data.meta = self.meta_getter(response)
         return data
 
-    def do(self, method, path, urn=None, callback=None, data=None,
-           timeout=None, **query):
+    def make_url(self, path, urn=None):
         urlparts = [self.uri, self.urn if urn is None else urn]
         urlparts.extend(path)
         url = '/'.join(filter(None, (x.strip('/') for x in urlparts)))
@@ -105,25 +198,131 @@ class Service(object):
             if not parts[0].endswith('/'):
                 parts[0] += '/'
                 url = ''.join(parts)
+        return url
+
+    def do(self, method, path, urn=None, callback=None, data=None,
+           timeout=None, **query):
+        url = self.make_url(path, urn)
         return self.adapter.request(method, url, callback=callback, data=data,
                                     query=query, timeout=timeout)
 
     def get(self, *path, **kwargs):
         return self.do('get', path, **kwargs)
 
+    def submit(self, method, *path, urn=None, data=None, timeout=None,
+               **query):
+        """ Start a request and return a `concurrent.futures.Future` of its
+        result instead of blocking.  Requires `loop_thread=True`. """
+        submit = getattr(self.adapter, 'submit', None)
+        if submit is None:
+            raise TypeError('submit requires loop_thread=True')
+        return submit(method, self.make_url(path, urn), data=data,
+                      query=query, timeout=timeout)
+
+    def get_stream(self, *path, urn=None, timeout=None, decoder=None,
+                   data_key='data', meta_key='meta', **query):
+        """ Fetch a list resource with its records decoded and produced as
+        the response body arrives, so the whole body is never held in
+        memory.  The result is iterable (`async for` in aio mode) and has a
+        `meta` attribute.  The `data_getter` and `meta_getter` of the service
+        are not used for successful responses. """
+        parser = m_data.JSONListParser(data_key, decoder)
+        return self.adapter.stream('get', self.make_url(path, urn), parser,
+                                   query=query, timeout=timeout,
+                                   meta_key=meta_key)
+
+    def get_many(self, items, *path, concurrency=8, ordered=True,
+                 multiget=False, multiget_size=100, id_key='id', **kwargs):
+        """ Concurrently GET each of `items`, which are IDs or path tuples
+        relative to `path`.  The result is an `Outcome(key, data, error)`
+        per item; a failed item sets `error` instead of failing the batch.
+        Outcomes are returned as a list in input order or, with
+        `ordered=False`, produced as they complete.  In aio mode await the
+        list or use `async for` respectively.
+
+        With `multiget` the IDs are fetched in chunks of `multiget_size`
+        using a Tastypie style `set/1;2;3/` endpoint and matched to the
+        results by their `id_key` value. """
+        if multiget:
+            ids = [str(x) for x in items]
+            calls = [(tuple(ids[i:i + multiget_size]),
+                      functools.partial(self.multiget, path,
+                                        ids[i:i + multiget_size], **kwargs))
+                     for i in range(0, len(ids), multiget_size)]
+            expand = functools.partial(self.expand_multiget, id_key=id_key)
+        else:
+            calls = [(x, functools.partial(self.get, *path, *(
+                      x if isinstance(x, tuple) else (str(x),)), **kwargs))
+                     for x in items]
+            expand = None
+        if ordered:
+            return self.adapter.gather_outcomes(calls, concurrency, expand)
+        return self.adapter.iter_outcomes(calls, concurrency, expand)
+
+    def multiget(self, path, ids, timeout=None, **query):
+        """ GET several resources at once from a `set/1;2;3/` endpoint. """
+        url = self.make_url(tuple(path) + ('set',))
+        if not url.endswith('/'):
+            url += '/'
+        url += ';'.join(ids)
+        if self.trailing_slash:
+            url += '/'
+        return self.adapter.request('get', url, query=query, timeout=timeout)
+
+    @staticmethod
+    def expand_multiget(outcome, id_key='id'):
+        """ Split the outcome of a multiget into an outcome per ID. """
+        if outcome.error is not None:
+            return [base_adapter.Outcome(x, None, outcome.error)
+                    for x in outcome.key]
+        found = dict((str(x[id_key]), x) for x in outcome.data or ())
+        return [base_adapter.Outcome(x, found[x], None) if x in found else
+                base_adapter.Outcome(x, None, KeyError(x))
+                for x in outcome.key]
+
+    def resource(self, *path, urn=None):
+        """ A `Resource` handle for `path` with its URL computed once. """
+        return Resource(self, path, urn)
+
     def get_pager(self, *path, **kwargs):
         """ A generator for all the results a resource can provide. The pages
-        are lazily loaded. """
+        are lazily loaded.  Use `prefetch` to request up to N pages ahead of
+        the page being consumed.
+
+        With `concurrency` set the pages after the first are computed from
+        its `total_count` and fetched concurrently.  Pages are produced in
+        order unless `ordered=False` is given. """
+        return self.make_pager(self.get, path, kwargs)
+
+    def make_pager(self, getter, path, kwargs):
         page_arg = kwargs.pop('page_size', None)
         limit_arg = kwargs.pop('limit', None)
+        options = {'prefetch': kwargs.pop('prefetch', 0)}
+        concurrency = kwargs.pop('concurrency', None)
+        ordered = kwargs.pop('ordered', True)
+        if concurrency:
+            options['concurrency'] = concurrency
+            options['ordered'] = ordered
         kwargs['limit'] = page_arg or limit_arg or self.default_page_size
-        return self.adapter.get_pager(self.get, path, kwargs)
+        return self.adapter.get_pager(getter, path, kwargs, **options)
 
     def post(self, *path_and_data, **kwargs):
         path = list(path_and_data)
         data = path.pop(-1)
         return self.do('post', path, data=data, **kwargs)
 
+    def bulk_writer(self, *path, method='patch', objects_key='objects',
+                    **options):
+        """ Buffer objects added with `add` and write them in batches with
+        Tastypie style `{"objects": [...]}` list requests.  See
+        `adapters.base.BulkWriterBase` for the `options`.  Use as a context
+        manager (`async with` in aio mode). """
+
+        def send(batch):
+            return self.do(method, path, data={objects_key: batch})
+        options.setdefault('encode', self.serializer.encode)
+        return self.adapter.bulk_writer(send, **options)
+
     def delete(self, *path, **kwargs):
         data = kwargs.pop('data', None)
         return self.do('delete', path, data=data, **kwargs)
@@ -142,6 +341,68 @@ class Service(object):
         if self.closing or self.adapter is None:
             return
         self.closing = True
-        adapter = self.adatper
+        adapter = self.adapter
         self.adapter = None
         return adapter.close()
+
+
+class Resource(object):
+    """ A handle on a resource of a `Service`, e.g. `svc.resource('users')`.
+    The URL prefix is computed once so calls only join their own path, if
+    any, onto it. """
+
+    def __init__(self, service, path, urn=None):
+        self.service = service
+        self.path = tuple(path)
+        self.url = service.make_url(self.path, urn)
+        self.prefix = self.url.rstrip('/') + '/'
+
+    def __repr__(self):
+        return '<%s: %s>' % (type(self).__name__, self.url)
+
+    def make_url(self, path):
+        tail = '/'.join(filter(None, (x.strip('/') for x in path)))
+        if not tail:
+            return self.url
+        url = self.prefix + tail
+        if self.service.trailing_slash:
+            parts = self.service.urlpartition.split(url, 1)
+            if not parts[0].endswith('/'):
+                parts[0] += '/'
+                url = ''.join(parts)
+        return url
+
+    def do(self, method, path, urn=None, callback=None, data=None,
+           timeout=None, **query):
+        if urn is None:
+            url = self.make_url(path)
+        else:
+            url = self.service.make_url(path, urn)
+        return self.service.adapter.request(method, url, callback=callback,
+                                            data=data, query=query,
+                                            timeout=timeout)
+
+    def get(self, *path, **kwargs):
+        return self.do('get', path, **kwargs)
+
+    def get_pager(self, *path, **kwargs):
+        return self.service.make_pager(self.get, path, kwargs)
+
+    def post(self, *path_and_data, **kwargs):
+        path = list(path_and_data)
+        data = path.pop(-1)
+        return self.do('post', path, data=data, **kwargs)
+
+    def delete(self, *path, **kwargs):
+        data = kwargs.pop('data', None)
+        return self.do('delete', path, data=data, **kwargs)
+
+    def put(self, *path_and_data, **kwargs):
+        path = list(path_and_data)
+        data = path.pop(-1)
+        return self.do('put', path, data=data, **kwargs)
+
+    def patch(self, *path_and_data, **kwargs):
+        path = list(path_and_data)
+        data = path.pop(-1)
+        return self.do('patch', path, data=data, **kwargs)
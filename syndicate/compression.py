@@ -0,0 +1,153 @@
+'''
+Compression of request bodies and statistics on compressed transfers.
+'''
+
+import gzip
+import threading
+import zlib
+from . import stats as m_stats
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def compress_gzip(data, level):
+    return gzip.compress(data, compresslevel=6 if level is None else level,
+                         mtime=0)
+
+
+def compress_deflate(data, level):
+    # HTTP's deflate coding is the zlib format, not raw deflate.
+    return zlib.compress(data, -1 if level is None else level)
+
+
+def compress_br(data, level):
+    # Brotli's default quality of 11 is too slow for request bodies.
+    return brotli.compress(data, quality=5 if level is None else level)
+
+
+def compress_zstd(data, level):
+    return zstandard.ZstdCompressor(level=3 if level is None else level). \
+        compress(data)
+
+
+compressors = {
+    'gzip': compress_gzip,
+    'deflate': compress_deflate,
+}
+if brotli is not None:
+    compressors['br'] = compress_br
+if zstandard is not None:
+    compressors['zstd'] = compress_zstd
+
+
+def compress(encoding, data, level=None):
+    """ Compress bytes with a content coding named in `compressors`.  A
+    module function so it can be run in other processes. """
+    return compressors[encoding](data, level)
+
+
+class Totals(object):
+    """ Sizes before and after compression of some bodies. """
+
+    def __init__(self):
+        self.count = 0
+        self.bytes = 0
+        self.wire_bytes = 0
+        self.ratio = m_stats.Histogram()
+
+    def add(self, size, wire_size):
+        self.count += 1
+        self.bytes += size
+        self.wire_bytes += wire_size
+        self.ratio.add(wire_size / size)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "bytes": self.bytes,
+            "wire_bytes": self.wire_bytes,
+            "ratio": self.ratio.summary()
+        }
+
+
+class Compression(object):
+    """ Compress POST, PUT and PATCH bodies of at least `threshold` bytes
+    with `encoding` ('gzip', 'deflate' and, when brotli or zstandard are
+    installed, 'br' or 'zstd') at `level`.  Bodies that don't get smaller
+    are sent as is.
+
+    Responses are decompressed by the HTTP library, which by default asks
+    for every encoding it can decode.  `accept` replaces that list in the
+    `Accept-Encoding` header; an empty one asks for `identity`.
+
+    The ratio of sent to original size of each compressed request, and of
+    received to decoded size of each compressed response, is kept for
+    `stats()`. """
+
+    def __init__(self, encoding='gzip', threshold=1024, level=None,
+                 accept=None, methods=('POST', 'PUT', 'PATCH')):
+        if encoding not in compressors:
+            raise ValueError('Unsupported encoding: %r' % encoding)
+        self.encoding = encoding
+        self.threshold = threshold
+        self.level = level
+        self.accept = accept
+        self.methods = frozenset(x.upper() for x in methods)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def accept_encoding(self):
+        """ Value for the `Accept-Encoding` header or None to leave the HTTP
+        library's default. """
+        if self.accept is None:
+            return None
+        return ', '.join(self.accept) or 'identity'
+
+    def applies(self, method, data):
+        """ Whether a body, measured in bytes, should be compressed. """
+        if data is None or method.upper() not in self.methods:
+            return False
+        if isinstance(data, str):
+            data = data.encode()
+        return len(data) >= self.threshold
+
+    def encode(self, data):
+        """ Return the body to send for the encoded body `data` and the
+        headers to add to the request, if any. """
+        if isinstance(data, str):
+            data = data.encode()
+        return self.finish(data, compress(self.encoding, data, self.level))
+
+    def finish(self, data, compressed):
+        """ Like `encode` with `data` already compressed. """
+        if len(compressed) >= len(data):
+            self.record('requests', len(data), len(data))
+            return data, None
+        self.record('requests', len(data), len(compressed))
+        return compressed, {"content-encoding": self.encoding}
+
+    def record(self, kind, size, wire_size):
+        """ Count a compressed 'requests' or 'responses' body. """
+        if not size:
+            return
+        with self.lock:
+            self.totals[kind].add(size, wire_size)
+
+    def reset(self):
+        with self.lock:
+            self.totals = {
+                "requests": Totals(),
+                "responses": Totals()
+            }
+
+    def stats(self):
+        with self.lock:
+            return dict((k, x.summary()) for k, x in self.totals.items())
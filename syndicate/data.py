@@ -2,6 +2,7 @@
 Serialize data to/from foreign data types into python.
 '''
 
+import codecs
 import collections
 import datetime
 import dateutil.parser
@@ -9,11 +10,114 @@ import json
 import re
 from xml.etree import ElementTree
 
-Serializer = collections.namedtuple('Serializer', 'mime, encode, decode')
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# When `raw` is set the decoder accepts the response body as bytes.
+Serializer = collections.namedtuple('Serializer', 'mime, encode, decode, raw')
+Serializer.__new__.__defaults__ = (False,)
 
 
 class DictResponse(dict):
-    pass
+    """ A dict that may defer the conversion of some values until they are
+    first read.  The `lazy` attribute maps those keys to their converter.
+    Converted values replace the raw ones so each is converted once. """
+
+    lazy = None
+
+    def resolve(self, key):
+        convert = self.lazy.pop(key)
+        value = convert(super().__getitem__(key))
+        super().__setitem__(key, value)
+        return value
+
+    def resolve_all(self):
+        """ Convert any values that are still pending. """
+        if self.lazy:
+            for key in list(self.lazy):
+                self.resolve(key)
+
+    def __getitem__(self, key):
+        if self.lazy and key in self.lazy:
+            return self.resolve(key)
+        return super().__getitem__(key)
+
+    def __setitem__(self, key, value):
+        if self.lazy:
+            self.lazy.pop(key, None)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        if self.lazy:
+            self.lazy.pop(key, None)
+        super().__delitem__(key)
+
+    def __iter__(self):
+        # Overriding this keeps dict(self) off the C fast path, which would
+        # otherwise copy unconverted values.
+        return super().__iter__()
+
+    def __eq__(self, other):
+        self.resolve_all()
+        if isinstance(other, DictResponse):
+            other.resolve_all()
+        return super().__eq__(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        self.resolve_all()
+        return super().__repr__()
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        self.resolve_all()
+        return super().items()
+
+    def values(self):
+        self.resolve_all()
+        return super().values()
+
+    def copy(self):
+        self.resolve_all()
+        return super().copy()
+
+    def pop(self, key, *default):
+        if self.lazy and key in self.lazy:
+            self.resolve(key)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        self.resolve_all()
+        return super().popitem()
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        if self.lazy:
+            for key in dict(*args, **kwargs):
+                self.lazy.pop(key, None)
+        super().update(*args, **kwargs)
 
 
 class ListResponse(list):
@@ -34,8 +138,9 @@ class NormalJSONDecoder(json.JSONDecoder):
 
     strict_iso_match = re.compile(r'\d{4}-\d{2}-\d{2}(T\d{2}:\d{2}\:\d{2}.*)?$')
 
-    def __init__(self):
-        super().__init__(object_hook=self.parse_object)
+    def __init__(self, **kwargs):
+        kwargs.setdefault('object_hook', self.parse_object)
+        super().__init__(**kwargs)
 
     def parse_object(self, data):
         """ Look for datetime looking strings. """
@@ -45,11 +150,379 @@ class NormalJSONDecoder(json.JSONDecoder):
                 data[key] = dateutil.parser.parse(value)
         return data
 
+
+class FastJSONDecoder(NormalJSONDecoder):
+    """ NormalJSONDecoder that parses with `datetime.fromisoformat` and only
+    falls back to dateutil for formats it can't handle.  If `datetime_fields`
+    is given only keys of those names are considered. """
+
+    def __init__(self, datetime_fields=None, **kwargs):
+        if datetime_fields is not None:
+            datetime_fields = frozenset(datetime_fields)
+        self.datetime_fields = datetime_fields
+        super().__init__(**kwargs)
+
+    def parse_datetime(self, value):
+        try:
+            return datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return dateutil.parser.parse(value)
+
+    def date_keys(self, data):
+        """ Generate the keys of `data` holding datetime looking strings. """
+        match = self.strict_iso_match.match
+        if self.datetime_fields is not None:
+            keys = self.datetime_fields.intersection(data)
+        else:
+            keys = data
+        for key in keys:
+            value = dict.__getitem__(data, key)
+            # Cheap test before the regex; most strings aren't dates.
+            if type(value) is str and value[4:5] == '-' and match(value):
+                yield key
+
+    def parse_object(self, data):
+        """ Look for datetime looking strings. """
+        for key in self.date_keys(data):
+            data[key] = self.parse_datetime(data[key])
+        return data
+
+
+class LazyJSONDecoder(FastJSONDecoder):
+    """ FastJSONDecoder that decodes objects into `DictResponse` and leaves
+    datetime looking strings alone until they are accessed. """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('object_pairs_hook', self.parse_pairs)
+        super().__init__(*args, **kwargs)
+
+    def parse_pairs(self, pairs):
+        data = DictResponse(pairs)
+        lazy = dict.fromkeys(self.date_keys(data), self.parse_datetime)
+        if lazy:
+            data.lazy = lazy
+        return data
+
+
+def fast_json_serializer(datetime_fields=None):
+    """ Build a JSON serializer using FastJSONDecoder. """
+    return Serializer('application/json', NormalJSONEncoder().encode,
+                      FastJSONDecoder(datetime_fields).decode)
+
+
+def lazy_json_serializer(datetime_fields=None):
+    """ Build a JSON serializer using LazyJSONDecoder. """
+    return Serializer('application/json', NormalJSONEncoder().encode,
+                      LazyJSONDecoder(datetime_fields).decode)
+
+
+class JSONListParser(object):
+    """ Incremental parser for a JSON object that holds a large array under
+    `key`, e.g. `{"meta": {...}, "data": [...]}`.  Text is pushed in with
+    `feed` which returns the array items completed so far.  Every other
+    member of the outer object is collected in `envelope`. """
+
+    ws = ' \t\n\r'
+    # Characters that nest or end a value, outside and inside of strings.
+    structural = re.compile(r'[{}\[\]", \t\n\r]')
+    string_special = re.compile(r'["\\]')
+
+    def __init__(self, key='data', decoder=None):
+        self.key = key
+        self.decoder = decoder or FastJSONDecoder()
+        self.text = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.state = 'start'
+        self.member = None
+        self.first = True
+        self.envelope = {}
+        self.done = False
+        self.pending = None
+        self.depth = 0
+        self.in_string = False
+        self.skip = 0
+
+    def feed(self, chunk, eof=False):
+        """ Add bytes or text.  Set `eof` with the final chunk. """
+        if isinstance(chunk, bytes):
+            chunk = self.text.decode(chunk, final=eof)
+        if self.pending is not None:
+            # Only the new text is scanned until the pending value ends so
+            # a large value isn't decoded again with every chunk.
+            self.pending.append(chunk)
+            if not self.scan(chunk) and not eof:
+                return []
+            self.buf = ''.join(self.pending)
+            self.pending = None
+        else:
+            self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        items = []
+        while self.step(items, eof):
+            pass
+        if eof and not self.done:
+            raise ValueError('Truncated JSON stream')
+        return items
+
+    def skip_ws(self):
+        buf = self.buf
+        pos = self.pos
+        while pos < len(buf) and buf[pos] in self.ws:
+            pos += 1
+        self.pos = pos
+        return buf[pos] if pos < len(buf) else None
+
+    def expect(self, char, expected):
+        if char not in expected:
+            raise ValueError('Unexpected %r at %d in JSON stream' % (
+                             char, self.pos))
+        self.pos += 1
+
+    def value(self, eof):
+        """ Decode one value or return the `self` sentinel if the buffer
+        does not hold all of it yet. """
+        try:
+            value, end = self.decoder.raw_decode(self.buf, self.pos)
+        except ValueError:
+            if eof:
+                raise
+            return self.defer()
+        if not eof and type(value) in (int, float) and \
+           not self.buf[end:].strip('0123456789.eE+-'):
+            # The number may continue in the next chunk.
+            return self.defer()
+        self.pos = end
+        return value
+
+    def defer(self):
+        """ Hold the start of an incomplete value until `scan` sees its end.
+        Returns the `self` sentinel. """
+        text = self.buf[self.pos:]
+        self.depth = 0
+        self.in_string = False
+        self.skip = 0
+        if self.scan(text):
+            raise ValueError('Invalid value at %d in JSON stream' % self.pos)
+        self.pending = [text]
+        self.buf = ''
+        self.pos = 0
+        return self
+
+    def scan(self, text):
+        """ Follow the nesting of the pending value through `text`, keeping
+        the state between calls.  Returns True once the value has ended. """
+        depth = self.depth
+        in_string = self.in_string
+        pos = self.skip
+        end = len(text)
+        while pos < end:
+            if in_string:
+                m = self.string_special.search(text, pos)
+                if m is None:
+                    pos = end
+                    break
+                pos = m.end()
+                if m.group() == '\\':
+                    pos += 1  # Skip the escaped character.
+                    continue
+                in_string = False
+                if not depth:
+                    return True
+                continue
+            m = self.structural.search(text, pos)
+            if m is None:
+                pos = end
+                break
+            char = m.group()
+            pos = m.end()
+            if char == '"':
+                in_string = True
+            elif char in '{[':
+                depth += 1
+            elif char in '}]':
+                if depth <= 1:
+                    return True
+                depth -= 1
+            elif not depth:
+                return True  # A comma or whitespace after a literal.
+        self.depth = depth
+        self.in_string = in_string
+        self.skip = pos - end
+        return False
+
+    def step(self, items, eof):
+        """ Advance the state machine; returns False when more input is
+        needed. """
+        char = self.skip_ws()
+        if char is None or self.done:
+            return False
+        state = self.state
+        if state == 'start':
+            self.expect(char, '{')
+            self.state = 'member'
+        elif state == 'member':
+            if char == '}' and self.first:
+                self.pos += 1
+                self.done = True
+                return False
+            self.expect(char, '"')
+            self.pos -= 1
+            member = self.value(eof)
+            if member is self:
+                return False
+            self.member = member
+            self.first = False
+            self.state = 'colon'
+        elif state == 'colon':
+            self.expect(char, ':')
+            self.state = 'array' if self.member == self.key else 'value'
+        elif state == 'array':
+            if char == '[':
+                self.pos += 1
+                self.state = 'first_item'
+            else:
+                self.state = 'value'
+        elif state == 'first_item':
+            if char == ']':
+                self.pos += 1
+                self.state = 'next_member'
+            else:
+                self.state = 'item'
+        elif state == 'item':
+            item = self.value(eof)
+            if item is self:
+                return False
+            items.append(item)
+            self.state = 'next_item'
+        elif state == 'next_item':
+            self.expect(char, ',]')
+            if char == ']':
+                self.state = 'next_member'
+            else:
+                self.state = 'item'
+        elif state == 'value':
+            value = self.value(eof)
+            if value is self:
+                return False
+            self.envelope[self.member] = value
+            self.state = 'next_member'
+        elif state == 'next_member':
+            self.expect(char, ',}')
+            if char == '}':
+                self.done = True
+                return False
+            self.state = 'member'
+        return True
+
+
+class ListStream(object):
+    """ Iterable of the records of a list response, decoded as the body
+    arrives.  It can only be consumed once.  `meta` is available as soon as
+    it has been parsed, which is at the latest when iteration ends. """
+
+    def __init__(self, chunks, parser, meta_key='meta', close=None):
+        self.chunks = chunks
+        self.parser = parser
+        self.meta_key = meta_key
+        self.closer = close
+
+    @property
+    def meta(self):
+        return self.parser.envelope.get(self.meta_key)
+
+    def __iter__(self):
+        try:
+            for chunk in self.chunks:
+                yield from self.parser.feed(chunk)
+            yield from self.parser.feed(b'', eof=True)
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closer is not None:
+            self.closer()
+            self.closer = None
+
+
+def convert_objects(data, hook):
+    """ Apply an object hook to every dict in a decoded structure.  For use
+    with decoders that have no object hook of their own. """
+    stack = [data]
+    while stack:
+        x = stack.pop()
+        if type(x) is dict:
+            hook(x)
+            stack.extend(v for v in x.values() if type(v) in (dict, list))
+        elif type(x) is list:
+            stack.extend(v for v in x if type(v) in (dict, list))
+    return data
+
+
+def isoformat_default(obj):
+    if isinstance(obj, datetime.datetime):
+        return obj.isoformat()
+    raise TypeError('%r is not serializable' % (obj,))
+
+
+def orjson_serializer(datetime_fields=None):
+    """ Build a JSON serializer using orjson. """
+    hook = FastJSONDecoder(datetime_fields).object_hook
+    return Serializer('application/json', orjson.dumps,
+                      lambda s: convert_objects(orjson.loads(s), hook),
+                      raw=True)
+
+
+def ujson_serializer(datetime_fields=None):
+    """ Build a JSON serializer using ujson. """
+    hook = FastJSONDecoder(datetime_fields).object_hook
+    return Serializer('application/json',
+                      lambda o: ujson.dumps(o, default=isoformat_default),
+                      lambda s: convert_objects(ujson.loads(s), hook),
+                      raw=True)
+
+
+def msgpack_serializer(datetime_fields=None):
+    """ Build a MessagePack serializer.  Datetimes travel as ISO strings. """
+    hook = FastJSONDecoder(datetime_fields).object_hook
+    return Serializer('application/msgpack',
+                      lambda o: msgpack.packb(o, default=isoformat_default),
+                      lambda s: msgpack.unpackb(s, raw=False,
+                                                object_hook=hook),
+                      raw=True)
+
+
 serializers = {
     'json': Serializer('application/json',
                        NormalJSONEncoder().encode,
                        NormalJSONDecoder().decode),
+    'json-fast': fast_json_serializer(),
+    'json-lazy': lazy_json_serializer(),
     'xml': Serializer('text/xml',
                       ElementTree.tostring,
-                      ElementTree.fromstring)
+                      ElementTree.fromstring,
+                      raw=True)
 }
+
+
+def register_serializer(name, serializer):
+    """ Make a serializer available by name, e.g. `Service(serializer=name)`.
+    """
+    if not hasattr(serializer, 'mime'):
+        raise TypeError('serializer must have a `mime` attribute')
+    serializers[name] = serializer
+
+
+def get_serializer(name_or_serializer):
+    """ Lookup a registered serializer unless given a serializer already. """
+    if hasattr(name_or_serializer, 'mime'):
+        return name_or_serializer
+    return serializers[name_or_serializer]
+
+
+if orjson is not None:
+    register_serializer('orjson', orjson_serializer())
+if ujson is not None:
+    register_serializer('ujson', ujson_serializer())
+if msgpack is not None:
+    register_serializer('msgpack', msgpack_serializer())
@@ -0,0 +1,159 @@
+'''
+Aggregated request statistics with log-bucketed latency histograms.
+'''
+
+import math
+import re
+import threading
+
+id_segment = re.compile(r'/\d+(?=/|$)')
+
+
+def default_endpoint(url):
+    """ The path of a URL with numeric segments replaced by `:id` so
+    requests for different objects of a resource share an endpoint. """
+    path = url.split('?', 1)[0].split('://', 1)[-1]
+    path = path[path.find('/'):] if '/' in path else '/'
+    return id_segment.sub('/:id', path)
+
+
+class Histogram(object):
+    """ Counts of positive values in buckets whose bounds grow by `growth`
+    from `low` to `high`.  Quantiles are accurate to within that ratio. """
+
+    def __init__(self, low=1e-5, high=600, growth=2 ** 0.125):
+        self.low = low
+        self.growth = growth
+        self.scale = 1 / math.log(growth)
+        self.counts = [0] * (int(math.log(high / low) * self.scale) + 2)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        if value <= self.low:
+            i = 0
+        else:
+            i = min(int(math.log(value / self.low) * self.scale) + 1,
+                    len(self.counts) - 1)
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                break
+        return max(min(self.low * self.growth ** i, self.max), self.min)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+
+class Series(object):
+    """ Statistics for one method and endpoint. """
+
+    def __init__(self):
+        self.statuses = {}
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.latency = Histogram()
+
+    def add(self, status, elapsed, bytes_in, bytes_out):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.latency.add(elapsed)
+
+
+class StatsRegistry(object):
+    """ Request counts by status, bytes sent and received and latency for
+    each method and endpoint.  Endpoints come from `endpoint(url)`; once
+    there are `max_endpoints` series new ones are counted as `other`.  A
+    single lock is held only to update a few counters, so it can stay on
+    in production with threads or asyncio. """
+
+    def __init__(self, endpoint=None, max_endpoints=1000):
+        self.endpoint = endpoint or default_endpoint
+        self.max_endpoints = max_endpoints
+        self.lock = threading.Lock()
+        self.series = {}
+
+    def record(self, method, url, status, elapsed, bytes_in=0, bytes_out=0):
+        """ Count a request attempt.  `status` is the HTTP status code or
+        'error' if no response was received. """
+        key = method.lower(), self.endpoint(url)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                if len(self.series) >= self.max_endpoints:
+                    key = key[0], 'other'
+                    series = self.series.get(key)
+                if series is None:
+                    series = self.series[key] = Series()
+            series.add(status, elapsed, bytes_in, bytes_out)
+
+    def reset(self):
+        with self.lock:
+            self.series = {}
+
+    def snapshot(self):
+        with self.lock:
+            return [{
+                "method": method,
+                "endpoint": endpoint,
+                "statuses": dict(x.statuses),
+                "bytes_in": x.bytes_in,
+                "bytes_out": x.bytes_out,
+                "latency": x.latency.summary()
+            } for (method, endpoint), x in sorted(self.series.items())]
+
+    def exposition(self, prefix='syndicate'):
+        """ The snapshot in the Prometheus text format.  Latency is given as
+        a summary with the 0.5, 0.95 and 0.99 quantiles. """
+        counts = ['# TYPE %s_requests_total counter' % prefix]
+        bytes_in = ['# TYPE %s_received_bytes_total counter' % prefix]
+        bytes_out = ['# TYPE %s_sent_bytes_total counter' % prefix]
+        latency = ['# TYPE %s_request_seconds summary' % prefix]
+        for x in self.snapshot():
+            labels = 'method="%s",endpoint="%s"' % (escape(x['method']),
+                                                    escape(x['endpoint']))
+            for status, n in sorted(x['statuses'].items(), key=str):
+                counts.append('%s_requests_total{%s,status="%s"} %d' % (
+                              prefix, labels, status, n))
+            bytes_in.append('%s_received_bytes_total{%s} %d' % (
+                            prefix, labels, x['bytes_in']))
+            bytes_out.append('%s_sent_bytes_total{%s} %d' % (
+                             prefix, labels, x['bytes_out']))
+            summary = x['latency']
+            for q, key in (('0.5', 'p50'), ('0.95', 'p95'), ('0.99', 'p99')):
+                latency.append('%s_request_seconds{%s,quantile="%s"} %r' % (
+                               prefix, labels, q, summary[key]))
+            latency.append('%s_request_seconds_sum{%s} %r' % (
+                           prefix, labels, summary['sum']))
+            latency.append('%s_request_seconds_count{%s} %d' % (
+                           prefix, labels, summary['count']))
+        return '\n'.join(counts + bytes_in + bytes_out + latency) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"'). \
+        replace('\n', '\\n')
@@ -2,13 +2,35 @@
 Sanity tests for the syndicate library.
 """
 
+import aiohttp.test_utils
+import aiohttp.web
+import asyncio
+import concurrent.futures
 import datetime
+import email.utils
+import json
+import os
 import syndicate
 import syndicate.adapters.aio as aio_adapter
+import syndicate.adapters.base
+import syndicate.adapters.http2 as http2_adapter
 import syndicate.adapters.requests as requests_adapter
+import syndicate.cache
+import syndicate.compression
 import syndicate.data
+import syndicate.stats
+import tempfile
+import threading
+import time
 import unittest
 
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:
+    h2 = None
+
 
 class BaseTest(unittest.TestCase):
 
@@ -29,6 +51,858 @@ class BaseTest(unittest.TestCase):
         output = syndicate.data.serializers['json'].decode(data)
         self.assertEqual(input_, output)
 
+    def test_fast_json_decoder(self):
+        data = syndicate.data.serializers['json'].encode({
+            "born": datetime.datetime(2018, 1, 28, 1, 2, 3, 4),
+            "day": "2018-01-28",
+            "odd": "2018-01-28T01:02:03 UTC",
+            "name": "2018-01-28 isn't a date",
+            "nested": [{"when": "2018-01-28T01:02:03"}]
+        })
+        normal = syndicate.data.serializers['json'].decode(data)
+        fast = syndicate.data.serializers['json-fast'].decode(data)
+        self.assertEqual(normal, fast)
+        self.assertEqual(fast['born'], datetime.datetime(2018, 1, 28, 1, 2, 3, 4))
+        self.assertEqual(fast['day'], datetime.datetime(2018, 1, 28))
+        self.assertEqual(fast['odd'].utcoffset(), datetime.timedelta(0))
+        self.assertEqual(fast['name'], "2018-01-28 isn't a date")
+        limited = syndicate.data.fast_json_serializer({'born'}).decode(data)
+        self.assertEqual(limited['born'], fast['born'])
+        self.assertEqual(limited['day'], "2018-01-28")
+        self.assertEqual(limited['nested'][0]['when'], "2018-01-28T01:02:03")
+
+    def test_lazy_json_decoder(self):
+        born = datetime.datetime(2018, 1, 28, 1, 2, 3, 4)
+        data = syndicate.data.serializers['json'].encode({
+            "born": born,
+            "name": "duck",
+            "nested": [{"when": born}]
+        })
+        lazy = syndicate.data.serializers['json-lazy'].decode(data)
+        self.assertIsInstance(lazy, syndicate.data.DictResponse)
+        self.assertEqual(dict.__getitem__(lazy, 'born'), born.isoformat())
+        self.assertEqual(lazy['born'], born)
+        self.assertEqual(dict.__getitem__(lazy, 'born'), born)
+        self.assertFalse(lazy.lazy)
+        nested = lazy['nested'][0]
+        self.assertEqual(dict(nested), {"when": born})
+        lazy = syndicate.data.serializers['json-lazy'].decode(data)
+        self.assertEqual(lazy, syndicate.data.serializers['json'].decode(data))
+        lazy = syndicate.data.serializers['json-lazy'].decode(data)
+        lazy['born'] = 'replaced'
+        self.assertEqual(lazy.get('born'), 'replaced')
+        self.assertEqual(syndicate.data.serializers['json'].encode(lazy),
+                         data.replace(born.isoformat(), 'replaced', 1))
+
+    @unittest.skipUnless(syndicate.data.orjson, 'orjson not installed')
+    def test_orjson_serializer(self):
+        input_ = {
+            "born": datetime.datetime(2018, 1, 28, 1, 2, 3, 4),
+            "nested": [{"when": datetime.datetime(2018, 1, 28)}],
+            "name": "duck"
+        }
+        serializer = syndicate.data.serializers['orjson']
+        data = serializer.encode(input_)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(serializer.decode(data), input_)
+
+    def test_content_negotiation(self):
+        s = syndicate.Service(uri='https://tld', accept=('xml', 'json'))
+        self.assertEqual(s.adapter.get_header('accept'),
+                         'application/json, text/xml;q=0.9')
+        self.assertEqual(s.adapter.get_header('content-type'),
+                         'application/json')
+        decode = s.adapter.decode
+        self.assertEqual(decode(b'{"a": 1}', 'application/json'), {"a": 1})
+        self.assertEqual(decode(b'<a>1</a>', 'text/xml; charset=utf-8').text,
+                         '1')
+        self.assertEqual(decode(b'{"a": 1}', 'text/plain'), {"a": 1})
+        self.assertEqual(decode(b'{"a": 1}'), {"a": 1})
+
+
+class StreamTests(unittest.TestCase):
+
+    doc = {
+        "meta": {"next": None, "total_count": 4},
+        "data": [
+            {"id": 1, "name": "a \\\"]}, ", "born": "2018-01-28T01:02:03"},
+            {"id": 2.5e-3, "tags": [1, [2, {}]]},
+            None,
+            12345
+        ],
+        "success": True
+    }
+
+    def test_parser_chunks(self):
+        body = syndicate.data.serializers['json'].encode(self.doc).encode()
+        expect = syndicate.data.serializers['json'].decode(body.decode())
+        for size in range(1, 20):
+            parser = syndicate.data.JSONListParser()
+            chunks = [body[i:i + size] for i in range(0, len(body), size)]
+            stream = syndicate.data.ListStream(chunks, parser)
+            self.assertEqual(stream.meta, None)
+            self.assertEqual(list(stream), expect['data'])
+            self.assertEqual(stream.meta, expect['meta'])
+            self.assertEqual(parser.envelope['success'], True)
+
+    def test_parser_large_item(self):
+        calls = []
+
+        class Decoder(syndicate.data.FastJSONDecoder):
+            def raw_decode(self, s, idx=0):
+                calls.append(idx)
+                return super().raw_decode(s, idx)
+        item = {"text": "x\\\"]}" * 2000, "nested": [[{"a": 1}]] * 100}
+        body = syndicate.data.serializers['json'].encode({
+            "data": [item, 1]}).encode()
+        parser = syndicate.data.JSONListParser(decoder=Decoder())
+        items = []
+        for i in range(0, len(body), 100):
+            items.extend(parser.feed(body[i:i + 100]))
+        items.extend(parser.feed(b'', eof=True))
+        self.assertEqual(items, [item, 1])
+        self.assertLess(len(calls), 10)
+
+    def test_limiter_slot(self):
+        server = ItemServer()
+        uri = server.start_in_thread()
+        s = syndicate.Service(uri=uri, max_per_host=1)
+        try:
+            stream = s.get_stream('items', limit=4)
+            self.assertEqual(s.adapter.limiter.in_flight, 1)
+            self.assertEqual(list(stream), [0, 1, 2, 3])
+            self.assertEqual(s.adapter.limiter.in_flight, 0)
+            self.assertEqual(s.get('items', '1'), {"id": "1"})
+            self.assertEqual(s.adapter.limiter.in_flight, 0)
+        finally:
+            s.close()
+            server.stop()
+
+    def test_aio_limiter_slot(self):
+        server = ItemServer()
+
+        async def test():
+            uri = await server.start()
+            s = syndicate.Service(uri=uri, aio=True, max_per_host=1)
+            try:
+                stream = await s.get_stream('items', limit=4)
+                self.assertEqual(s.adapter.limiter.in_flight, 1)
+                self.assertEqual([x async for x in stream], [0, 1, 2, 3])
+                self.assertEqual(s.adapter.limiter.in_flight, 0)
+                self.assertEqual(await s.get('items', '1'), {"id": "1"})
+            finally:
+                await s.close()
+                await server.runner.cleanup()
+        run_async(test())
+
+    def test_parser_errors(self):
+        for bad in (b'{"data": [1, 2', b'{"data": [1 2]}', b'[1]', b'{"a"}'):
+            parser = syndicate.data.JSONListParser()
+            self.assertRaises(ValueError, parser.feed, bad, eof=True)
+        parser = syndicate.data.JSONListParser()
+        self.assertEqual(parser.feed(b' {"data": null} ', eof=True), [])
+        self.assertEqual(parser.envelope, {"data": None})
+
+
+class FakeResponse(object):
+
+    def __init__(self, status_code=200, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = requests_adapter.requests.structures. \
+            CaseInsensitiveDict(headers or {})
+        self.ok = status_code < 400
+        self.elapsed = datetime.timedelta(seconds=0.001)
+
+    def close(self):
+        pass
+
+
+class FakeSession(object):
+    """ Stand in for `requests.Session` that replies with a list of canned
+    responses and records each request. """
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.headers = {}
+        self.auth = None
+        self.adapters = {}
+
+    def get_adapter(self, url):
+        return self.adapters.get(url[:url.index(':') + 3],
+                                 requests_adapter.requests.adapters.
+                                 HTTPAdapter())
+
+    def mount(self, prefix, adapter):
+        self.adapters[prefix] = adapter
+
+    def request(self, method, url, **kwargs):
+        self.requests.append(dict(kwargs, method=method, url=url))
+        resp = self.responses.pop(0)
+        if callable(resp):
+            self.responses.insert(0, resp)
+            resp = resp(method, url, **kwargs)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+def ok_response(data, headers=None):
+    body = syndicate.data.serializers['json'].encode({
+        "success": True,
+        "data": data,
+        "meta": {"total_count": 1}
+    }).encode()
+    return FakeResponse(200, body, headers)
+
+
+class CacheTests(unittest.TestCase):
+
+    def service(self, *responses, **cache_config):
+        cache = syndicate.cache.ResponseCache(**cache_config)
+        s = syndicate.Service(uri='https://tld', cache=cache)
+        s.adapter.session = FakeSession(*responses)
+        return s
+
+    def test_revalidate(self):
+        s = self.service(ok_response({"a": 1}, {"etag": '"v1"'}),
+                         FakeResponse(304),
+                         ok_response({"a": 2}, {"etag": '"v2"'}))
+        first = s.get('foo', x=1)
+        self.assertEqual(first, {"a": 1})
+        first['a'] = 'mutated'
+        second = s.get('foo', x=1)
+        self.assertEqual(second, {"a": 1})
+        self.assertEqual(second.meta, {"total_count": 1})
+        self.assertEqual(s.get('foo', x=1), {"a": 2})
+        reqs = s.adapter.session.requests
+        self.assertEqual(reqs[0]['headers'], None)
+        self.assertEqual(reqs[1]['headers'], {'if-none-match': '"v1"'})
+        self.assertEqual(reqs[2]['headers'], {'if-none-match': '"v1"'})
+        self.assertEqual(s.cache.stats(), {"hits": 1, "misses": 2,
+                                           "revalidated": 1, "size": 1})
+
+    def test_fresh(self):
+        s = self.service(ok_response([1, 2]), ok_response([3]), fresh=60)
+        self.assertEqual(s.get('foo'), [1, 2])
+        self.assertEqual(s.get('foo'), [1, 2])
+        self.assertEqual(s.get('foo', page=2), [3])
+        self.assertEqual(len(s.adapter.session.requests), 2)
+        self.assertEqual(s.cache.hits, 1)
+
+    def test_lru_and_disk(self):
+        with tempfile.TemporaryDirectory() as d:
+            s = self.service(ok_response(1, {"last-modified": "x"}),
+                             ok_response(2, {"last-modified": "y"}),
+                             FakeResponse(304), maxsize=1, directory=d)
+            s.get('one')
+            s.get('two')
+            self.assertEqual(list(s.cache.entries), ['https://tld/two/'])
+            self.assertEqual(s.get('one'), 1)
+            self.assertEqual(s.adapter.session.requests[2]['headers'],
+                             {'if-modified-since': 'x'})
+
+    def test_disk_limits(self):
+        with tempfile.TemporaryDirectory() as d:
+            cache = syndicate.cache.ResponseCache(maxsize=2, directory=d,
+                                                  disk_maxsize=10)
+            for i in range(50):
+                cache.store(str(i), i, {"etag": "x"})
+            self.assertEqual(len(cache.entries), 2)
+            self.assertLessEqual(len(os.listdir(d)), 10)
+            self.assertEqual(cache.get('49').data, 49)
+            with open(cache.disk.path('49'), 'wb') as f:
+                f.write(b'\x80\x04\x95garbage')
+            self.assertIsNone(cache.disk.get('49'))
+            self.assertFalse(os.path.exists(cache.disk.path('49')))
+            old = time.time() - 7200
+            for x in os.listdir(d):
+                os.utime(os.path.join(d, x), (old, old))
+            syndicate.cache.ResponseCache(directory=d)
+            self.assertEqual(os.listdir(d), [])
+
+    def test_deep_copies(self):
+        s = self.service(ok_response({"a": {"b": [1]}}, {"etag": '"v1"'}),
+                         FakeResponse(304))
+        first = s.get('foo')
+        first['a']['b'].append(2)
+        self.assertEqual(s.get('foo'), {"a": {"b": [1]}})
+
+
+class CoalesceTests(unittest.TestCase):
+
+    def test_coalesce(self):
+        calls = []
+        sent = []
+
+        async def send(method, url, data, query, timeout):
+            calls.append((method, url, query))
+            await asyncio.sleep(0.01)
+            if query.get('fail'):
+                raise ValueError('boom')
+            data = syndicate.data.DictResponse(url=url)
+            data.meta = None
+            sent.append(data)
+            return data
+
+        async def test():
+            s = syndicate.Service(uri='https://tld', aio=True, coalesce=True)
+            s.adapter.send = send
+            try:
+                results = await asyncio.gather(*[s.get('foo', x=1)
+                                                 for i in range(5)])
+                self.assertEqual(len(calls), 1)
+                self.assertEqual(results, [{"url": "https://tld/foo/"}] * 5)
+                self.assertIs(results[0], sent[0])
+                for x in results[1:]:
+                    self.assertIsNot(x, sent[0])
+                self.assertEqual(len(set(map(id, results))), 5)
+                self.assertIs(await s.get('foo', x=1), sent[1])
+                await asyncio.gather(s.get('foo', x=1), s.get('foo', x=2),
+                                     s.post('foo', {}))
+                self.assertEqual(len(calls), 5)
+                results = await asyncio.gather(s.get('foo', fail=1),
+                                               s.get('foo', fail=1),
+                                               return_exceptions=True)
+                self.assertEqual(len(calls), 6)
+                for x in results:
+                    self.assertIsInstance(x, ValueError)
+                self.assertEqual(s.adapter.inflight, {})
+            finally:
+                await s.adapter.close()
+        run_async(test())
+
+
+class LimiterTests(unittest.TestCase):
+
+    def test_token_bucket(self):
+        bucket = syndicate.adapters.base.TokenBucket(100, burst=2)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.01, delta=0.002)
+        self.assertAlmostEqual(bucket.reserve(), 0.02, delta=0.002)
+
+    def test_thread_limiter(self):
+        limiter = requests_adapter.ThreadLimiter(max_per_host=2)
+        active = []
+        peak = []
+
+        def work(url):
+            host = limiter.acquire(url)
+            try:
+                active.append(url)
+                peak.append(len([x for x in active if x == url]))
+                time.sleep(0.01)
+                active.remove(url)
+            finally:
+                limiter.release(host)
+        threads = [threading.Thread(target=work, args=(url,))
+                   for url in ['https://a/1', 'https://b/1'] * 5]
+        for x in threads:
+            x.start()
+        for x in threads:
+            x.join()
+        self.assertEqual(max(peak), 2)
+        stats = limiter.stats()
+        self.assertEqual(stats['requests'], 10)
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertGreater(stats['total_wait'], 0)
+
+    def test_thread_limiter_bucket_error(self):
+        limiter = requests_adapter.ThreadLimiter(max_per_host=1, rate=1)
+
+        def reserve():
+            raise KeyboardInterrupt()
+        limiter.bucket.reserve = reserve
+        self.assertRaises(KeyboardInterrupt, limiter.acquire, 'https://a/')
+        limiter.bucket = None
+        limiter.release(limiter.acquire('https://a/'))
+        self.assertEqual(limiter.stats()['queued'], 0)
+
+    def test_aio_limiter(self):
+        limiter = aio_adapter.AioLimiter(max_per_host=3, rate=1000, burst=5)
+        active = []
+
+        async def work():
+            host = await limiter.acquire('https://a/foo')
+            try:
+                active.append(limiter.in_flight)
+                await asyncio.sleep(0.005)
+            finally:
+                limiter.release(host)
+
+        async def test():
+            await asyncio.gather(*[work() for i in range(10)])
+        run_async(test())
+        self.assertEqual(max(active), 3)
+        self.assertEqual(limiter.stats()['requests'], 10)
+
+
+class RetryTests(unittest.TestCase):
+
+    def test_policy(self):
+        policy = syndicate.adapters.base.RetryPolicy(attempts=3, backoff=1)
+        now = time.monotonic()
+        self.assertIsNone(policy.delay('get', 0, now, status=500))
+        self.assertIsNone(policy.delay('post', 0, now, status=503))
+        self.assertIsNone(policy.delay('get', 2, now, status=503))
+        self.assertLessEqual(policy.delay('get', 0, now, status=503), 1)
+        self.assertLessEqual(policy.delay('get', 1, now, error=OSError()), 2)
+        self.assertIsNone(policy.delay('get', 0, now, status=503,
+                                       headers={'retry-after': '86400'}))
+        self.assertEqual(policy.delay('get', 0, now, status=503,
+                                      headers={'retry-after': '5'}), 5)
+        empty = syndicate.adapters.base.RetryPolicy(statuses=(), methods=())
+        self.assertIsNone(empty.delay('get', 0, now, status=503))
+        self.assertIsNone(empty.delay('get', 0, now, error=OSError()))
+        self.assertEqual(policy.delay('get', 0, now, status=429,
+                                      headers={'retry-after': '3'}), 3)
+        when = email.utils.formatdate(time.time() + 60, usegmt=True)
+        self.assertIsNone(policy.delay('get', 0, now, status=429,
+                                       headers={'retry-after': when}))
+        policy.max_backoff = 120
+        self.assertAlmostEqual(policy.delay('get', 0, now, status=429,
+                               headers={'retry-after': when}), 60, delta=2)
+        policy.deadline = 2
+        self.assertIsNone(policy.delay('get', 0, now, status=429,
+                                       headers={'retry-after': '3'}))
+
+    def test_requests_adapter(self):
+        s = syndicate.Service(uri='https://tld', retry=syndicate.adapters.
+                              base.RetryPolicy(backoff=0.001))
+        s.adapter.session = FakeSession(
+            requests_adapter.requests.ConnectionError(),
+            FakeResponse(503, headers={'retry-after': '0'}),
+            ok_response({"a": 1}))
+        self.assertEqual(s.get('foo'), {"a": 1})
+        self.assertEqual(len(s.adapter.session.requests), 3)
+        s.adapter.session = FakeSession(FakeResponse(503), ok_response(1))
+        self.assertIsNone(s.post('foo', {}))
+        self.assertEqual(len(s.adapter.session.requests), 1)
+        s.adapter.session = FakeSession(*[FakeResponse(503)] * 3)
+        self.assertIsNone(s.get('foo'))
+        self.assertEqual(len(s.adapter.session.requests), 3)
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def test_states(self):
+        Breaker = syndicate.adapters.base.CircuitBreaker
+        breaker = Breaker(threshold=0.5, min_requests=4, cooldown=0.01)
+        for failed in (False, True, False):
+            breaker.allow()
+            breaker.record(0.1, failed)
+        self.assertEqual(breaker.state, Breaker.CLOSED)
+        breaker.allow()
+        breaker.record(0.1, True)
+        self.assertEqual(breaker.state, Breaker.OPEN)
+        self.assertRaises(syndicate.client.CircuitOpenError, breaker.allow)
+        time.sleep(0.01)
+        breaker.allow()
+        self.assertEqual(breaker.state, Breaker.HALF_OPEN)
+        self.assertRaises(syndicate.client.CircuitOpenError, breaker.allow)
+        breaker.record(0.1, True)
+        self.assertEqual(breaker.state, Breaker.OPEN)
+        time.sleep(0.01)
+        breaker.allow()
+        breaker.record(0.1, None)
+        self.assertEqual(breaker.state, Breaker.HALF_OPEN)
+        breaker.allow()
+        breaker.record(0.1, False)
+        self.assertEqual(breaker.state, Breaker.CLOSED)
+
+    def test_stale_outcomes(self):
+        Breaker = syndicate.adapters.base.CircuitBreaker
+        breaker = Breaker(min_requests=1, cooldown=0.01)
+        stale = [breaker.allow() for i in range(3)]
+        breaker.record(0.1, True, stale[0])
+        self.assertEqual(breaker.state, Breaker.OPEN)
+        time.sleep(0.01)
+        probe = breaker.allow()
+        breaker.record(0.1, True, stale[1])
+        breaker.record(0.1, False, stale[2])
+        self.assertEqual(breaker.state, Breaker.HALF_OPEN)
+        breaker.record(0.1, False, probe)
+        self.assertEqual(breaker.state, Breaker.CLOSED)
+        breaker.record(0.1, True, probe)
+        self.assertEqual(breaker.state, Breaker.CLOSED)
+
+    def test_slow(self):
+        Breaker = syndicate.adapters.base.CircuitBreaker
+        breaker = Breaker(min_requests=2, slow=1)
+        breaker.record(2, False)
+        breaker.record(0.5, False)
+        self.assertEqual(breaker.state, Breaker.OPEN)
+
+    def test_service(self):
+        breaker = syndicate.adapters.base.CircuitBreaker(min_requests=2,
+                                                         cooldown=60)
+        s = syndicate.Service(uri='https://tld', breaker=breaker)
+        self.assertEqual(s.circuit_state, 'closed')
+        s.adapter.session = FakeSession(FakeResponse(500), FakeResponse(502))
+        s.get('foo')
+        s.get('foo')
+        self.assertEqual(s.circuit_state, 'open')
+        self.assertRaises(syndicate.client.ServiceError, s.get, 'foo')
+        self.assertEqual(len(s.adapter.session.requests), 2)
+        self.assertEqual(breaker.stats()['rejected'], 1)
+
+
+class GetManyTests(unittest.TestCase):
+
+    def route(self, method, url, **kwargs):
+        time.sleep(0.001)
+        name = url.rstrip('/').rsplit('/', 1)[1]
+        if name == 'bad':
+            return FakeResponse(500, b'{"success": false}')
+        if '/set/' in url:
+            return ok_response([{"id": int(x)} for x in name.split(';')
+                                if x != '404'])
+        return ok_response({"id": name})
+
+    def service(self, **kwargs):
+        s = syndicate.Service(uri='https://tld', **kwargs)
+        s.adapter.session = FakeSession(self.route)
+        return s
+
+    def test_ordered(self):
+        s = self.service()
+        outcomes = s.get_many([1, 'bad', ('sub', 'x')] + list(range(2, 20)),
+                              'foo', concurrency=4)
+        self.assertEqual([x.key for x in outcomes],
+                         [1, 'bad', ('sub', 'x')] + list(range(2, 20)))
+        self.assertEqual(outcomes[0].data, {"id": "1"})
+        self.assertIsInstance(outcomes[1].error,
+                              syndicate.client.ResponseError)
+        self.assertEqual(outcomes[2].data, {"id": "x"})
+        self.assertEqual(s.adapter.session.requests[0]['url'],
+                         'https://tld/foo/1/')
+
+    def test_unordered(self):
+        s = self.service()
+        outcomes = list(s.get_many(range(20), 'foo', ordered=False))
+        self.assertEqual(sorted(x.key for x in outcomes), list(range(20)))
+        self.assertFalse(any(x.error for x in outcomes))
+
+    def test_unordered_close(self):
+        s = self.service()
+        route = self.route
+
+        def slow(*args, **kwargs):
+            time.sleep(0.05)
+            return route(*args, **kwargs)
+        s.adapter.session = FakeSession(slow)
+        outcomes = s.get_many(range(20), 'foo', concurrency=2, ordered=False)
+        next(outcomes)
+        outcomes.close()
+        self.assertLessEqual(len(s.adapter.session.requests), 4)
+
+    def test_multiget(self):
+        s = self.service()
+        outcomes = s.get_many([1, 2, 404, 3, 4], 'foo', multiget=True,
+                              multiget_size=2)
+        self.assertEqual([x.key for x in outcomes], ['1', '2', '404', '3', '4'])
+        self.assertEqual(outcomes[0].data, {"id": 1})
+        self.assertIsInstance(outcomes[2].error, KeyError)
+        urls = sorted(x['url'] for x in s.adapter.session.requests)
+        self.assertEqual(urls, ['https://tld/foo/set/1;2/',
+                                'https://tld/foo/set/4/',
+                                'https://tld/foo/set/404;3/'])
+
+    def test_aio(self):
+        async def get(*path, **kwargs):
+            await asyncio.sleep(0.001)
+            if path[-1] == 'bad':
+                raise ValueError(path)
+            return path
+
+        async def test():
+            s = syndicate.Service(uri='https://tld', aio=True)
+            s.get = get
+            try:
+                outcomes = await s.get_many(['a', 'bad', 'c'], 'foo')
+                self.assertEqual([x.data for x in outcomes],
+                                 [('foo', 'a'), None, ('foo', 'c')])
+                self.assertIsInstance(outcomes[1].error, ValueError)
+                keys = [x.key async for x in s.get_many(['a', 'b'], 'foo',
+                                                        ordered=False)]
+                self.assertEqual(sorted(keys), ['a', 'b'])
+            finally:
+                await s.adapter.close()
+        run_async(test())
+
+
+class BulkWriterTests(unittest.TestCase):
+
+    def route(self, method, url, data=None, **kwargs):
+        objects = syndicate.data.serializers['json'].decode(
+            data.decode())['objects']
+        if any(x.get('bad') for x in objects):
+            return FakeResponse(400, b'{"success": false}')
+        return FakeResponse(202, b'')
+
+    def test_batches(self):
+        s = syndicate.Service(uri='https://tld')
+        s.adapter.session = FakeSession(self.route)
+        with s.bulk_writer('foo', max_objects=3) as w:
+            for i in range(7):
+                w.add({"id": i, "bad": i == 4})
+        requests = s.adapter.session.requests
+        self.assertEqual(len(requests), 3)
+        self.assertEqual({x['method'] for x in requests}, {'patch'})
+        self.assertEqual(w.written, 4)
+        self.assertEqual(sorted(x[0]['id'] for x in w.failures), [3, 4, 5])
+        self.assertIsInstance(w.failures[0][1], syndicate.client.ResponseError)
+
+    def test_max_bytes_and_delay(self):
+        s = syndicate.Service(uri='https://tld')
+        s.adapter.session = FakeSession(self.route)
+        w = s.bulk_writer('foo', method='post', max_bytes=30, max_delay=0.01)
+        w.add({"id": 1, "name": "x" * 20})
+        w.add({"id": 2})
+        self.assertEqual(w.batch, [{"id": 2}])
+        time.sleep(0.1)
+        self.assertEqual(w.batch, [])
+        w.close()
+        self.assertEqual(w.batches, 2)
+        self.assertEqual(w.written, 2)
+
+    def test_close_during_timer_flush(self):
+        sent = []
+        release = threading.Event()
+
+        def send(batch):
+            release.wait()
+            sent.append(batch)
+        w = requests_adapter.RequestsBulkWriter(send, max_objects=2,
+                                                max_delay=0.01,
+                                                max_in_flight=1)
+        for i in range(3):
+            w.add(i)
+        time.sleep(0.05)  # The timer's flush now waits for a free slot.
+        closer = threading.Thread(target=w.close)
+        closer.start()
+        time.sleep(0.02)
+        release.set()
+        closer.join()
+        self.assertEqual(sent, [[0, 1], [2]])
+        self.assertEqual(w.written, 3)
+
+    def test_aio(self):
+        sent = []
+        inflight = [0, 0]
+
+        async def send(batch):
+            inflight[0] += 1
+            inflight[1] = max(inflight)
+            await asyncio.sleep(0.01)
+            inflight[0] -= 1
+            sent.append(batch)
+
+        async def test():
+            async with aio_adapter.AioBulkWriter(send, max_objects=2,
+                                                 max_in_flight=2) as w:
+                for i in range(9):
+                    await w.add(i)
+            self.assertEqual(sorted(sum(sent, [])), list(range(9)))
+            self.assertEqual(len(sent), 5)
+            self.assertEqual(inflight[1], 2)
+            w = aio_adapter.AioBulkWriter(send, max_delay=0.01)
+            await w.add('late')
+            await asyncio.sleep(0.05)
+            self.assertEqual(sent[-1], ['late'])
+            await w.close()
+        run_async(test())
+
+
+class DecodeOffloadTests(unittest.TestCase):
+
+    def serve(self, test):
+        async def handler(request):
+            return aiohttp.web.json_response({
+                "success": True,
+                "data": {"name": request.match_info['name']}
+            })
+
+        async def run():
+            app = aiohttp.web.Application()
+            app.router.add_get('/{name}/', handler)
+            server = aiohttp.test_utils.TestServer(app)
+            await server.start_server()
+            try:
+                await test('http://127.0.0.1:%d' % server.port)
+            finally:
+                await server.close()
+        run_async(run())
+
+    def test_thread(self):
+        threads = []
+        json = syndicate.data.serializers['json']
+
+        def decode(body):
+            threads.append(threading.get_ident())
+            return json.decode(body)
+
+        async def test(uri):
+            serializer = json._replace(decode=decode)
+            pool = concurrent.futures.ThreadPoolExecutor(1)
+            s = syndicate.Service(uri=uri, aio=True, serializer=serializer,
+                                  decode_threshold=60, decode_executor=pool)
+            try:
+                self.assertEqual(await s.get('a'), {"name": "a"})
+                self.assertEqual(await s.get('x' * 40), {"name": "x" * 40})
+            finally:
+                await s.adapter.close()
+                pool.shutdown()
+            self.assertEqual(threads[0], threading.get_ident())
+            self.assertNotEqual(threads[1], threading.get_ident())
+        self.serve(test)
+
+    def test_process(self):
+        async def test(uri):
+            pool = concurrent.futures.ProcessPoolExecutor(1)
+            s = syndicate.Service(uri=uri, aio=True, decode_threshold=0,
+                                  decode_executor=pool)
+            try:
+                self.assertEqual(await s.get('a'), {"name": "a"})
+            finally:
+                await s.adapter.close()
+                pool.shutdown()
+            s = syndicate.Service(uri=uri, aio=True, decode_threshold=0,
+                                  decode_executor=pool, serializer=syndicate.
+                                  data.fast_json_serializer())
+            try:
+                with self.assertRaises(ValueError):
+                    await s.get('a')
+            finally:
+                await s.adapter.close()
+        self.serve(test)
+
+
+class InstrumentationTests(unittest.TestCase):
+
+    def test_sync(self):
+        s = syndicate.Service(uri='https://tld', max_per_host=2)
+        s.adapter.session = FakeSession(ok_response({"id": 1}),
+                                        ok_response({"id": 2}))
+        events = []
+        s.subscribe(events.append)
+        s.get('foo', callback=lambda x: None)
+        self.assertEqual([x.phase for x in events],
+                         ['queue', 'ttfb', 'read', 'decode', 'filter',
+                          'callback'])
+        self.assertEqual({(x.method, x.url) for x in events},
+                         {('get', 'https://tld/foo/')})
+        self.assertEqual(events[1].elapsed, 0.001)
+        s.unsubscribe(events.append)
+        s.get('foo')
+        self.assertEqual(len(events), 6)
+
+    def test_sync_connect(self):
+        server = ItemServer()
+        uri = server.start_in_thread().replace('127.0.0.1', 'localhost')
+        try:
+            s = syndicate.Service(uri=uri)
+            events = []
+            s.subscribe(events.append)
+            s.get('items', '1')
+            s.get('items', '2')
+        finally:
+            server.stop()
+        phases = [x.phase for x in events]
+        self.assertEqual(phases, ['dns', 'connect', 'ttfb', 'read', 'decode',
+                                  'filter', 'ttfb', 'read', 'decode',
+                                  'filter'])
+        # The first request's time to the first byte excludes connecting.
+        self.assertGreater(events[2].elapsed, 0.04)
+        self.assertLess(events[1].elapsed, 0.04)
+
+    def test_aio(self):
+        async def handler(request):
+            return aiohttp.web.json_response({"success": True, "data": {}})
+
+        async def test():
+            app = aiohttp.web.Application()
+            app.router.add_get('/foo/', handler)
+            server = aiohttp.test_utils.TestServer(app, host='localhost')
+            await server.start_server()
+            url = 'http://localhost:%d' % server.port
+            s = syndicate.Service(uri=url, aio=True)
+            events = []
+            s.subscribe(events.append)
+            try:
+                await s.get('foo', callback=lambda x: None)
+                await s.get('foo')
+            finally:
+                await s.adapter.close()
+                await server.close()
+            phases = [x.phase for x in events]
+            self.assertEqual(phases[:2], ['dns', 'connect'])
+            self.assertEqual(phases[2:], ['ttfb', 'read', 'decode', 'filter',
+                                          'callback', 'ttfb', 'read',
+                                          'decode', 'filter'])
+            self.assertEqual(events[-1].url, url + '/foo/')
+        run_async(test())
+
+
+class StatsTests(unittest.TestCase):
+
+    def test_histogram(self):
+        h = syndicate.stats.Histogram()
+        for i in range(1, 1001):
+            h.add(i / 1000)
+        self.assertEqual((h.count, h.min, h.max), (1000, 0.001, 1))
+        for q in (0.5, 0.95, 0.99):
+            self.assertAlmostEqual(h.quantile(q) / q, 1, delta=h.growth - 1)
+        self.assertIsNone(syndicate.stats.Histogram().quantile(0.5))
+
+    def test_endpoint(self):
+        endpoint = syndicate.stats.default_endpoint
+        self.assertEqual(endpoint('https://tld/api/users/12/?x=1'),
+                         '/api/users/:id/')
+        self.assertEqual(endpoint('https://tld/v1/a12/34'), '/v1/a12/:id')
+        self.assertEqual(endpoint('https://tld'), '/')
+
+    def test_service(self):
+        s = syndicate.Service(uri='https://tld', metrics=True)
+        s.adapter.session = FakeSession(ok_response({"id": 1}),
+                                        FakeResponse(404, b'{"success": false}'),
+                                        requests_adapter.requests.Timeout())
+        s.post('users', {"name": "x"})
+        self.assertRaises(syndicate.client.ResponseError, s.get, 'users', '1')
+        self.assertRaises(requests_adapter.requests.Timeout, s.get, 'users',
+                          '2')
+        stats = s.stats()['requests']
+        self.assertEqual([(x['method'], x['endpoint'], x['statuses'])
+                          for x in stats], [
+            ('get', '/users/:id/', {404: 1, 'error': 1}),
+            ('post', '/users/', {200: 1}),
+        ])
+        self.assertEqual(stats[1]['bytes_out'], len('{"name": "x"}'))
+        self.assertEqual(stats[1]['latency']['count'], 1)
+        text = s.stats_text()
+        self.assertIn('syndicate_requests_total{method="get",'
+                      'endpoint="/users/:id/",status="404"} 1\n', text)
+        self.assertIn('syndicate_request_seconds_count{method="post",'
+                      'endpoint="/users/"} 1\n', text)
+        s.reset_stats()
+        self.assertEqual(s.stats(), {'requests': []})
+
+    def test_bytes_out(self):
+        serializer = syndicate.data.Serializer(
+            'application/json', json.JSONEncoder(ensure_ascii=False).encode,
+            json.loads, None)
+        s = syndicate.Service(uri='https://tld', serializer=serializer,
+                              metrics=True)
+        s.adapter.session = FakeSession(ok_response({"id": 1}))
+        s.post('users', {"name": "\u00e9"})
+        body = s.adapter.session.requests[0]['data']
+        self.assertEqual(body, '{"name": "\u00e9"}'.encode())
+        stats = s.stats()['requests']
+        self.assertEqual(stats[0]['bytes_out'], len(body))
+
 
 class AuthTests(unittest.TestCase):
 
@@ -62,6 +936,473 @@ class AuthTests(unittest.TestCase):
             self.assertEqual(request.headers, {'foo': 'replace', 'bar': 'foo'})
 
 
+class PoolTests(unittest.TestCase):
+
+    def test_registry(self):
+        pools = syndicate.adapters.base.PoolRegistry(default_size=3)
+        self.assertEqual(pools.key('https://Tld'), ('https', 'tld', 443))
+        self.assertEqual(pools.key('http://tld:8080/x/'),
+                         ('http', 'tld', 8080))
+        pools.set_size('https://tld:443/', 7)
+        self.assertEqual(pools.size(pools.key('https://tld')), 7)
+        self.assertEqual(pools.size(pools.key('http://tld')), 3)
+
+    def test_requests(self):
+        pools = syndicate.adapters.base.PoolRegistry()
+        pools.set_size('https://tld', 20)
+        a = syndicate.Service(uri='https://tld', shared_pool=pools)
+        b = syndicate.Service(uri='https://tld:443/', urn='/api',
+                              shared_pool=pools)
+        c = syndicate.Service(uri='https://tld')
+        adapter = a.adapter.session.get_adapter('https://tld/foo/')
+        self.assertIs(b.adapter.session.get_adapter('https://tld:443/api/'),
+                      adapter)
+        self.assertIsNot(c.adapter.session.get_adapter('https://tld/foo/'),
+                         adapter)
+        self.assertEqual(adapter._pool_maxsize, 20)
+        old = adapter.poolmanager
+        old.connection_from_url('https://tld/')
+        a.adapter.ensure_pool_size(30)
+        self.assertIs(a.adapter.session.get_adapter('https://tld/'), adapter)
+        self.assertEqual(adapter._pool_maxsize, 30)
+        self.assertEqual(adapter.poolmanager.connection_pool_kw['maxsize'],
+                         30)
+        self.assertEqual(len(old.pools), 0)
+        default = a.adapter.session.get_adapter('https://other/')
+        self.assertEqual(default._pool_maxsize, 30)
+        self.assertIsNone(a.close())
+
+    def test_aio_warmup(self):
+        peers = set()
+
+        async def handler(request):
+            peers.add(request.transport.get_extra_info('peername'))
+            return aiohttp.web.json_response({"success": True, "data": {}})
+
+        async def test():
+            app = aiohttp.web.Application()
+            app.router.add_route('*', '/{tail:.*}', handler)
+            server = aiohttp.test_utils.TestServer(app)
+            await server.start_server()
+            uri = 'http://127.0.0.1:%d' % server.port
+            pools = syndicate.adapters.base.PoolRegistry()
+            a = syndicate.Service(uri=uri, aio=True, shared_pool=pools)
+            b = syndicate.Service(uri=uri, aio=True, shared_pool=pools)
+            try:
+                self.assertIs(a.adapter.session.connector,
+                              b.adapter.session.connector)
+                self.assertEqual(await a.warmup(3), 3)
+                self.assertEqual(len(peers), 3)
+                await b.get('foo')
+                self.assertEqual(len(peers), 3)
+                await a.close()
+                self.assertFalse(b.adapter.session.connector.closed)
+            finally:
+                await b.close()
+                for x in pools.clear():
+                    await x.close()
+                await server.close()
+        run_async(test())
+
+
+class LocalServer(object):
+    """ Serves `app` on a free local port. """
+
+    async def start(self):
+        self.runner = aiohttp.web.AppRunner(self.app)
+        await self.runner.setup()
+        await aiohttp.web.TCPSite(self.runner, '127.0.0.1', 0).start()
+        return 'http://%s:%d' % self.runner.addresses[0][:2]
+
+    def start_in_thread(self):
+        loop = asyncio.new_event_loop()
+        uri = loop.run_until_complete(self.start())
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+
+        def stop():
+            asyncio.run_coroutine_threadsafe(self.runner.cleanup(),
+                                             loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+        self.stop = stop
+        return uri
+
+
+class LoginServer(LocalServer):
+    """ Issues a new session cookie per login; sessions can be revoked. """
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.logins = 0
+        self.valid = set()
+        self.app = aiohttp.web.Application()
+        self.app.router.add_post('/login/', self.login)
+        self.app.router.add_get('/data/', self.data)
+
+    async def login(self, request):
+        await asyncio.sleep(self.delay)
+        self.logins += 1
+        session = str(self.logins)
+        self.valid.add(session)
+        resp = aiohttp.web.json_response({"success": True})
+        resp.set_cookie('session', session)
+        return resp
+
+    async def data(self, request):
+        if request.cookies.get('session') not in self.valid:
+            return aiohttp.web.json_response({"success": False}, status=401)
+        return aiohttp.web.json_response({
+            "success": True,
+            "data": {"session": request.cookies['session']}
+        })
+
+
+class LoginAuthTests(unittest.TestCase):
+
+    def test_aio(self):
+        async def test():
+            server = LoginServer()
+            uri = await server.start()
+            auth = aio_adapter.LoginAuth(uri + '/login/', ttl=0.2)
+            s = syndicate.Service(uri=uri, auth=auth, aio=True)
+            try:
+                results = await asyncio.gather(*[s.get('data')
+                                                 for i in range(10)])
+                self.assertEqual({x['session'] for x in results}, {'1'})
+                self.assertEqual(server.logins, 1)
+                server.valid.clear()
+                results = await asyncio.gather(*[s.get('data')
+                                                 for i in range(5)])
+                self.assertEqual({x['session'] for x in results}, {'2'})
+                self.assertEqual(server.logins, 2)
+                await asyncio.sleep(0.2)
+                # Served with the old session while renewing.
+                self.assertEqual((await s.get('data'))['session'], '2')
+                await asyncio.sleep(0.05)
+                self.assertEqual((await s.get('data'))['session'], '3')
+            finally:
+                await s.adapter.close()
+                await server.runner.cleanup()
+        run_async(test())
+
+    def test_requests(self):
+        server = LoginServer()
+        uri = server.start_in_thread()
+        auth = requests_adapter.LoginAuth(uri + '/login/', ttl=0.2)
+        s = syndicate.Service(uri=uri, auth=auth)
+        try:
+            self.assertIs(auth.session, s.adapter.session)
+            with concurrent.futures.ThreadPoolExecutor(5) as pool:
+                results = list(pool.map(lambda x: s.get('data'), range(5)))
+            self.assertEqual({x['session'] for x in results}, {'1'})
+            self.assertEqual(server.logins, 1)
+            server.valid.clear()
+            self.assertEqual(s.get('data')['session'], '2')
+            time.sleep(0.2)
+            self.assertEqual(s.get('data')['session'], '2')
+            time.sleep(0.05)
+            self.assertEqual(s.get('data')['session'], '3')
+        finally:
+            s.adapter.session.close()
+            server.stop()
+
+    def test_timeouts_requests(self):
+        server = LoginServer(delay=0.3)
+        uri = server.start_in_thread()
+        auth = requests_adapter.LoginAuth(uri + '/login/')
+        s = syndicate.Service(uri=uri, auth=auth, request_timeout=0.05)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(1) as pool:
+                f = pool.submit(s.get, 'data')
+                time.sleep(0.02)
+                # The login is in progress without holding the lock.
+                self.assertTrue(auth.lock.acquire(blocking=False))
+                auth.lock.release()
+                self.assertRaises(requests_adapter.requests.Timeout,
+                                  f.result)
+            self.assertIsNone(auth.pending)
+        finally:
+            s.adapter.session.close()
+            server.stop()
+
+    def test_timeouts_aio(self):
+        async def test():
+            server = LoginServer(delay=0.3)
+            uri = await server.start()
+            auth = aio_adapter.LoginAuth(uri + '/login/')
+            s = syndicate.Service(uri=uri, auth=auth, aio=True,
+                                  request_timeout=0.05)
+            try:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await s.get('data')
+            finally:
+                await s.adapter.close()
+                await server.runner.cleanup()
+        run_async(test())
+
+
+class ItemServer(LocalServer):
+    """ Tastypie style listing of `total` items after a `delay`. """
+
+    def __init__(self, total=10, delay=0.05):
+        self.total = total
+        self.delay = delay
+        self.app = aiohttp.web.Application()
+        self.app.router.add_get('/items/', self.list)
+        self.app.router.add_get('/items/{id}/', self.detail)
+
+    async def list(self, request):
+        limit = int(request.query.get('limit', 3))
+        offset = int(request.query.get('offset', 0))
+        end = min(offset + limit, self.total)
+        return aiohttp.web.json_response({
+            "success": True,
+            "meta": {
+                "total_count": self.total,
+                "next": '/items/?limit=%d&offset=%d' % (limit, end)
+                        if end < self.total else None
+            },
+            "data": list(range(offset, end))
+        })
+
+    async def detail(self, request):
+        await asyncio.sleep(self.delay)
+        return aiohttp.web.json_response({
+            "success": True,
+            "data": {"id": request.match_info['id']}
+        })
+
+
+class LoopThreadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ItemServer()
+        uri = self.server.start_in_thread()
+        self.s = syndicate.Service(uri=uri, loop_thread=True, metrics=True)
+
+    def tearDown(self):
+        self.s.close()
+        self.server.stop()
+
+    def test_blocking(self):
+        self.assertEqual(self.s.get('items', '1'), {"id": "1"})
+        self.assertEqual(list(self.s.get_pager('items', limit=3)),
+                         list(range(10)))
+        outcomes = self.s.get_many(range(3), 'items')
+        self.assertEqual([x.data for x in outcomes],
+                         [{"id": "0"}, {"id": "1"}, {"id": "2"}])
+        stream = self.s.get_stream('items', limit=4)
+        self.assertEqual(list(stream), [0, 1, 2, 3])
+        self.assertEqual(stream.meta['total_count'], 10)
+        self.assertEqual(self.s.stats()['requests'][0]['endpoint'],
+                         '/items/')
+
+    def test_futures(self):
+        start = time.monotonic()
+        futures = [self.s.submit('get', 'items', str(i)) for i in range(20)]
+        self.assertIsInstance(futures[0], concurrent.futures.Future)
+        self.assertEqual([x.result()['id'] for x in futures],
+                         [str(i) for i in range(20)])
+        # All in flight at once on the loop thread.
+        self.assertLess(time.monotonic() - start, 0.05 * 5)
+        self.assertRaises(TypeError, syndicate.Service(uri='http://x').submit,
+                          'get')
+
+
+class H2Protocol(asyncio.Protocol):
+    """ Minimal cleartext HTTP/2 server that answers each request with its
+    path after `delay` seconds. """
+
+    def __init__(self, connections, delay):
+        config = h2.config.H2Configuration(client_side=False,
+                                           header_encoding='utf-8')
+        self.conn = h2.connection.H2Connection(config=config)
+        self.connections = connections
+        self.delay = delay
+        self.requests = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.connections.append(self)
+        self.conn.initiate_connection()
+        transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        for event in self.conn.receive_data(data):
+            if isinstance(event, h2.events.RequestReceived):
+                self.requests[event.stream_id] = dict(event.headers)
+            elif isinstance(event, h2.events.DataReceived):
+                self.conn.acknowledge_received_data(
+                    event.flow_controlled_length, event.stream_id)
+            elif isinstance(event, h2.events.StreamEnded):
+                headers = self.requests.pop(event.stream_id)
+                asyncio.ensure_future(self.respond(event.stream_id, headers))
+        self.transport.write(self.conn.data_to_send())
+
+    async def respond(self, stream_id, headers):
+        await asyncio.sleep(self.delay)
+        body = syndicate.data.serializers['json'].encode({
+            "success": True,
+            "data": {"path": headers[':path']}
+        }).encode()
+        self.conn.send_headers(stream_id, [
+            (':status', '200'),
+            ('content-type', 'application/json'),
+            ('content-length', str(len(body)))
+        ])
+        self.conn.send_data(stream_id, body, end_stream=True)
+        self.transport.write(self.conn.data_to_send())
+
+
+@unittest.skipIf(h2 is None or http2_adapter.httpx is None,
+                 'requires httpx[http2]')
+class Http2Tests(unittest.TestCase):
+
+    def test_multiplexed(self):
+        connections = []
+
+        async def test():
+            loop = asyncio.get_event_loop()
+            server = await loop.create_server(
+                lambda: H2Protocol(connections, 0.05), '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            s = syndicate.Service(uri='http://127.0.0.1:%d' % port,
+                                  aio=True, http2=True,
+                                  connector_config={"http1": False})
+            try:
+                start = time.monotonic()
+                results = await asyncio.gather(*[s.get('foo', str(i))
+                                                 for i in range(20)])
+                self.assertLess(time.monotonic() - start, 0.05 * 5)
+                self.assertEqual([x['path'] for x in results],
+                                 ['/foo/%d/' % i for i in range(20)])
+                self.assertEqual(len(connections), 1)
+                items = await s.get('foo', x=1)
+                self.assertEqual(items, {"path": "/foo/?x=1"})
+                events = []
+                s.subscribe(events.append)
+                await s.get('foo')
+                self.assertEqual([x.phase for x in events],
+                                 ['ttfb', 'read', 'decode', 'filter'])
+                fresh = syndicate.Service(uri='http://127.0.0.1:%d' % port,
+                                          aio=True, http2=True,
+                                          connector_config={"http1": False})
+                events = []
+                fresh.subscribe(events.append)
+                await fresh.get('foo')
+                await fresh.close()
+                self.assertEqual([x.phase for x in events],
+                                 ['connect', 'ttfb', 'read', 'decode',
+                                  'filter'])
+            finally:
+                await s.close()
+                server.close()
+                await server.wait_closed()
+        run_async(test())
+
+    def test_requires_aio(self):
+        self.assertRaises(TypeError, syndicate.Service, uri='http://x',
+                          http2=True)
+
+
+class EchoServer(LocalServer):
+    """ Replies to writes with the request body, gzipped. """
+
+    def __init__(self):
+        self.encodings = []
+        self.app = aiohttp.web.Application()
+        self.app.router.add_route('*', '/echo/', self.echo)
+
+    async def echo(self, request):
+        self.encodings.append((request.headers.get('content-encoding'),
+                               request.headers.get('accept-encoding')))
+        data = await request.json() if request.can_read_body else None
+        resp = aiohttp.web.json_response({"success": True, "data": data})
+        resp.enable_compression(aiohttp.web.ContentCoding.gzip)
+        return resp
+
+
+class CompressionTests(unittest.TestCase):
+
+    data = {"items": ["x" * 20] * 200}
+
+    def test_policy(self):
+        c = syndicate.compression.Compression(threshold=100)
+        self.assertFalse(c.applies('post', 'x' * 99))
+        self.assertFalse(c.applies('get', 'x' * 100))
+        self.assertTrue(c.applies('patch', 'x' * 100))
+        self.assertTrue(c.applies('post', '\u00e9' * 50))
+        body, headers = c.encode('x' * 1000)
+        self.assertEqual(headers, {"content-encoding": "gzip"})
+        self.assertEqual(syndicate.compression.gzip.decompress(body),
+                         b'x' * 1000)
+        wire_bytes = len(body) + 1
+        body, headers = c.encode(b'\0')
+        self.assertEqual((body, headers), (b'\0', None))
+        stats = c.stats()['requests']
+        self.assertEqual((stats['count'], stats['bytes']), (2, 1001))
+        self.assertEqual(stats['wire_bytes'], wire_bytes)
+        self.assertLess(stats['ratio']['min'], 0.1)
+        self.assertEqual(stats['ratio']['max'], 1)
+        self.assertIsNone(c.accept_encoding())
+        self.assertEqual(syndicate.compression.Compression(
+            accept=()).accept_encoding(), 'identity')
+        self.assertRaises(ValueError, syndicate.compression.Compression,
+                          encoding='lzma')
+
+    def check_stats(self, s):
+        stats = s.stats()['compression']
+        for kind in ('requests', 'responses'):
+            self.assertEqual(stats[kind]['count'], 1)
+            self.assertLess(stats[kind]['wire_bytes'], stats[kind]['bytes'])
+
+    def test_sync(self):
+        server = EchoServer()
+        uri = server.start_in_thread()
+        try:
+            s = syndicate.Service(uri=uri, compress=True)
+            self.assertEqual(s.post('echo', self.data), self.data)
+            self.check_stats(s)
+            s.reset_stats()
+            self.assertEqual(s.stats()['compression']['requests']['count'],
+                             0)
+            s.adapter.compress.threshold = 10 ** 6
+            s.post('echo', self.data)
+        finally:
+            server.stop()
+        self.assertEqual([x[0] for x in server.encodings], ['gzip', None])
+
+    def test_aio(self):
+        server = EchoServer()
+
+        async def test(executor):
+            uri = await server.start()
+            try:
+                for config in ({}, {"decode_threshold": 100,
+                                    "decode_executor": executor}):
+                    s = syndicate.Service(uri=uri, aio=True, compress=True,
+                                          **config)
+                    self.assertEqual(await s.post('echo', self.data),
+                                     self.data)
+                    self.check_stats(s)
+                    await s.close()
+            finally:
+                await server.runner.cleanup()
+        with concurrent.futures.ThreadPoolExecutor(1) as executor:
+            run_async(test(executor))
+        self.assertEqual(server.encodings, [('gzip', 'gzip, deflate')] * 2)
+
+    def test_accept(self):
+        server = EchoServer()
+        uri = server.start_in_thread()
+        try:
+            c = syndicate.compression.Compression(accept=['deflate'])
+            s = syndicate.Service(uri=uri, compress=c)
+            s.get('echo')
+        finally:
+            server.stop()
+        self.assertEqual(server.encodings, [(None, 'deflate')])
+
+
 class URLTests(unittest.TestCase):
 
     valid_path_signatures = {
@@ -125,3 +1466,219 @@ class URLTests(unittest.TestCase):
         self.snoop_request(s, self.clean_url_filter)
         self.assertEqual(s.get('foo?hide=me'), 'tld/foo/?hide=me')
         self.assertEqual(s.get(urn='foo?hide=me'), 'tld/foo/?hide=me')
+
+    def test_resource_matches_service(self):
+        for trailing_slash in (True, False):
+            s = syndicate.Service(uri='https://tld/', urn='/api/v1',
+                                  trailing_slash=trailing_slash)
+            self.snoop_request(s, self.clean_url_filter)
+            for base in (('users',), ('/one/', 'two'), ()):
+                r = s.resource(*base)
+                for args in self.valid_path_signatures:
+                    self.assertEqual(r.get(*args), s.get(*(base + args)))
+                self.assertEqual(r.get('set/1;2'), s.get(*base, 'set/1;2'))
+                self.assertEqual(r.get('x', urn='/other'),
+                                 s.get('x', urn='/other'))
+
+    def test_resource_methods(self):
+        s = syndicate.Service(uri='https://tld')
+        s.adapter.session = FakeSession(lambda *na, **kw: ok_response({}))
+        users = s.resource('users')
+        users.get('1', limit=5)
+        users.post({"name": "x"})
+        users.patch('1', {"name": "y"})
+        users.put('1', {"name": "z"})
+        users.delete('1')
+        self.assertEqual([(x['method'], x['url'], x['params'])
+                          for x in s.adapter.session.requests], [
+            ('get', 'https://tld/users/1/', {'limit': 5}),
+            ('post', 'https://tld/users/', {}),
+            ('patch', 'https://tld/users/1/', {}),
+            ('put', 'https://tld/users/1/', {}),
+            ('delete', 'https://tld/users/1/', {}),
+        ])
+
+
+def run_async(coro):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+class FakePages(object):
+    """ Tastypie style getter that serves `pages` pages of `size` items. """
+
+    def __init__(self, pages=4, size=3, latency=0):
+        self.pages = pages
+        self.size = size
+        self.latency = latency
+        self.fetched = []
+
+    def page(self, offset):
+        data = syndicate.data.ListResponse(range(offset, offset + self.size))
+        offset += self.size
+        total = self.pages * self.size
+        data.meta = {
+            "limit": self.size,
+            "offset": offset - self.size,
+            "total_count": total,
+            "next": ('/next?offset=%d' % offset) if offset < total else None
+        }
+        return data
+
+    def offset(self, urn=None, offset=0, **query):
+        return int(urn.split('=')[1]) if urn else offset
+
+    def __call__(self, *path, **query):
+        offset = self.offset(**query)
+        self.fetched.append(offset)
+        time.sleep(self.latency)
+        return self.page(offset)
+
+    async def aio(self, *path, **query):
+        offset = self.offset(**query)
+        self.fetched.append(offset)
+        await asyncio.sleep(self.latency)
+        return self.page(offset)
+
+
+class RequestsPagerTests(unittest.TestCase):
+
+    def test_sequential(self):
+        pages = FakePages()
+        pager = requests_adapter.RequestsPager(pages, (), {})
+        self.assertEqual(len(pager), 12)
+        self.assertEqual(list(pager), list(range(12)))
+        self.assertEqual(pages.fetched, [0, 3, 6, 9])
+        self.assertRaises(StopIteration, next, pager)
+
+    def test_prefetch(self):
+        threads = set(threading.enumerate())
+        pages = FakePages(pages=10)
+        pager = requests_adapter.RequestsPager(pages, (), {}, prefetch=2)
+        self.assertEqual(next(pager), 0)
+        pager.pending[-1].result()
+        self.assertEqual(pages.fetched, [0, 3, 6])
+        self.assertEqual(list(pager), list(range(1, 30)))
+        self.assertEqual(pages.fetched, list(range(0, 30, 3)))
+        self.assertRaises(StopIteration, next, pager)
+        for x in set(threading.enumerate()) - threads:
+            x.join(1)
+            self.assertFalse(x.is_alive())
+
+
+class AioPagerTests(unittest.TestCase):
+
+    def consume(self, pager, count):
+        async def consume():
+            return [await next(pager) for i in range(count)]
+        return run_async(consume())
+
+    def test_sequential(self):
+        pages = FakePages()
+        pager = aio_adapter.AioPager(pages.aio, (), {})
+        self.assertEqual(self.consume(pager, 12), list(range(12)))
+        self.assertEqual(pages.fetched, [0, 3, 6, 9])
+
+    def test_prefetch(self):
+        pages = FakePages(pages=10)
+        pager = aio_adapter.AioPager(pages.aio, (), {}, prefetch=2)
+
+        async def consume():
+            first = await next(pager)
+            for i in range(5):
+                await asyncio.sleep(0)
+            return first
+        self.assertEqual(run_async(consume()), 0)
+        self.assertEqual(pages.fetched, [0, 3, 6])
+
+    def test_prefetch_all(self):
+        pages = FakePages(pages=10)
+        pager = aio_adapter.AioPager(pages.aio, (), {}, prefetch=3)
+        self.assertEqual(self.consume(pager, 30), list(range(30)))
+        self.assertEqual(pages.fetched, list(range(0, 30, 3)))
+
+    def test_exhausted(self):
+        pages = FakePages(pages=1)
+        pager = aio_adapter.AioPager(pages.aio, (), {})
+
+        async def consume():
+            items = [await next(pager) for i in range(3)]
+            with self.assertRaises(StopAsyncIteration):
+                await next(pager)
+            return items
+        self.assertEqual(run_async(consume()), [0, 1, 2])
+
+    def test_async_for(self):
+        for prefetch in (0, 1, 4):
+            pages = FakePages(pages=5)
+            pager = aio_adapter.AioPager(pages.aio, (), {}, prefetch=prefetch)
+
+            async def consume():
+                return [x async for x in pager]
+            self.assertEqual(run_async(consume()), list(range(15)))
+            self.assertEqual(pages.fetched, [0, 3, 6, 9, 12])
+
+    def test_iter_pages_prefetch(self):
+        pages = FakePages(pages=10)
+        pager = aio_adapter.AioPager(pages.aio, (), {}, prefetch=2)
+
+        async def consume():
+            async for page in pager.iter_pages():
+                for i in range(5):
+                    await asyncio.sleep(0)
+                return list(page)
+        self.assertEqual(run_async(consume()), [0, 1, 2])
+        self.assertEqual(pages.fetched, [0, 3, 6])
+
+
+class FanoutPagerTests(unittest.TestCase):
+
+    def test_requests_ordered(self):
+        pages = FakePages(pages=10, latency=0.001)
+        pager = requests_adapter.RequestsFanoutPager(pages, (), {'limit': 3},
+                                                     concurrency=4)
+        self.assertEqual(len(pager), 30)
+        self.assertEqual(list(pager), list(range(30)))
+        self.assertEqual(sorted(pages.fetched), list(range(0, 30, 3)))
+
+    def test_requests_unordered(self):
+        pages = FakePages(pages=10, latency=0.001)
+        pager = requests_adapter.RequestsFanoutPager(pages, (), {'limit': 3},
+                                                     concurrency=4,
+                                                     ordered=False)
+        self.assertEqual(sorted(pager), list(range(30)))
+
+    def test_requests_without_total_count(self):
+        pages = FakePages(pages=3)
+
+        def getter(*path, **query):
+            data = pages(*path, **query)
+            del data.meta['total_count']
+            return data
+        pager = requests_adapter.RequestsFanoutPager(getter, (), {'limit': 3},
+                                                     concurrency=4)
+        self.assertEqual(list(pager), list(range(9)))
+        self.assertEqual(pages.fetched, [0, 3, 6])
+
+    def test_requests_pool_size(self):
+        s = syndicate.Service(uri='https://tld')
+        s.get_pager('foo', concurrency=20)
+        adapter = s.adapter.session.get_adapter('https://tld/foo/')
+        self.assertEqual(adapter._pool_maxsize, 20)
+
+    def test_aio(self):
+        for ordered in (True, False):
+            pages = FakePages(pages=10, latency=0.001)
+            pager = aio_adapter.AioFanoutPager(pages.aio, (), {'limit': 3},
+                                               concurrency=4, ordered=ordered)
+
+            async def consume():
+                return [x async for x in pager]
+            items = run_async(consume())
+            if ordered:
+                self.assertEqual(items, list(range(30)))
+            else:
+                self.assertEqual(sorted(items), list(range(30)))